@@ -22,7 +22,9 @@ uniform sampler2D texSprites;
 uniform sampler2D texFont;
 uniform sampler2D texBlocks;
 uniform isampler2D texWorld;
+uniform isampler2D texWater;
 uniform sampler2D texShadow;
+uniform ivec2 world_ring;
 uniform vec2 offset;
 uniform vec2 camera;
 uniform float resolution;
@@ -51,6 +53,21 @@ ivec2 block_texture_size;
 int block_animation_rows;
 
 
+// World data (texWorld is a ring buffer offset by world_ring)
+ivec4 fetch_world(ivec2 coord) {
+    ivec2 size = textureSize(texWorld, 0);
+    coord = clamp(coord, ivec2(0), size - 1); // Blocks past the view edge would wrap to the opposite edge
+    return texelFetch(texWorld, (coord + world_ring) % size, 0);
+}
+
+// Water render flags (flags, level, width, height; same ring buffer as texWorld)
+ivec4 fetch_water(ivec2 coord) {
+    ivec2 size = textureSize(texWater, 0);
+    coord = clamp(coord, ivec2(0), size - 1); // Blocks past the view edge would wrap to the opposite edge
+    return texelFetch(texWater, (coord + world_ring) % size, 0);
+}
+
+
 // Image
 void draw_image() {
     int border = int(
@@ -156,7 +173,7 @@ void draw_background() {
     );
 
     // block data (foreground, plant, background, water level)
-    ivec4 block_data = texelFetch(texWorld, block_coord, 0);
+    ivec4 block_data = fetch_world(block_coord);
     
     // background block type
     int block_type = block_data.b;
@@ -187,7 +204,7 @@ void draw_background() {
     block_coord.y += on_edge_top - on_edge_bottom;
 
     // Get adjacent block color
-    block_type = texelFetch(texWorld, block_coord, 0).b;
+    block_type = fetch_world(block_coord).b;
     block_color = mix(get_color_block(block_type, source_pixel), block_color, block_color.a);
     block_color = mix(background_color, block_color, block_color.a);
 
@@ -349,15 +366,15 @@ vec4 get_color_foreground() {
                               gl_FragCoord.y / BLOCK_SIZE_DEST + offset.y);
 
     // Block data (foreground, plant, background, water level)
-    ivec4 block_data = texelFetch(texWorld, ivec2(block_coord), 0);
-    ivec4 block_data_left = texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y), 0);
-    ivec4 block_data_right = texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y), 0);
-    ivec4 block_data_top = texelFetch(texWorld, ivec2(block_coord.x, block_coord.y + 1), 0);
-    ivec4 block_data_bottom = texelFetch(texWorld, ivec2(block_coord.x, block_coord.y - 1), 0);
-    ivec4 block_data_top_left = texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y + 1), 0);
-    ivec4 block_data_top_right = texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y + 1), 0);
-    ivec4 block_data_bottom_left = texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y - 1), 0);
-    ivec4 block_data_bottom_right = texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y - 1), 0);
+    ivec4 block_data = fetch_world(ivec2(block_coord));
+    ivec4 block_data_left = fetch_world(ivec2(block_coord.x - 1, block_coord.y));
+    ivec4 block_data_right = fetch_world(ivec2(block_coord.x + 1, block_coord.y));
+    ivec4 block_data_top = fetch_world(ivec2(block_coord.x, block_coord.y + 1));
+    ivec4 block_data_bottom = fetch_world(ivec2(block_coord.x, block_coord.y - 1));
+    ivec4 block_data_top_left = fetch_world(ivec2(block_coord.x - 1, block_coord.y + 1));
+    ivec4 block_data_top_right = fetch_world(ivec2(block_coord.x + 1, block_coord.y + 1));
+    ivec4 block_data_bottom_left = fetch_world(ivec2(block_coord.x - 1, block_coord.y - 1));
+    ivec4 block_data_bottom_right = fetch_world(ivec2(block_coord.x + 1, block_coord.y - 1));
     
     // Block type
     int block_type = block_data.r;
@@ -469,7 +486,7 @@ vec4 get_color_foreground() {
     float distance_air = 3;
     for (int dx = -3; dx <= 3; dx += 1)
     for (int dy = -3; dy <= 3; dy += 1)
-    if (texelFetch(texWorld, ivec2(block_coord.x + dx, block_coord.y + dy), 0).r == 0) {
+    if (fetch_world(ivec2(block_coord.x + dx, block_coord.y + dy)).r == 0) {
         distance_air = min(distance_air, distance(vec2((dx + 0.5) * BLOCK_SIZE_SOURCE, (dy + 0.5) * BLOCK_SIZE_SOURCE), source_pixel) / 10);
     }
     vec4 overlay_color_sub = vec4(0, 0, 0, max(0, (distance_air - 1.5) / 1.5));
@@ -524,11 +541,11 @@ vec4 get_color_foreground() {
         block_coord += next_closest_block.zw;
         shadow_position += next_closest_block.zw;
 
-        block_data = texelFetch(texWorld, ivec2(block_coord), 0);
-        block_data_left = texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y), 0);
-        block_data_right = texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y), 0);
-        block_data_top = texelFetch(texWorld, ivec2(block_coord.x, block_coord.y + 1), 0);
-        block_data_bottom = texelFetch(texWorld, ivec2(block_coord.x, block_coord.y - 1), 0);
+        block_data = fetch_world(ivec2(block_coord));
+        block_data_left = fetch_world(ivec2(block_coord.x - 1, block_coord.y));
+        block_data_right = fetch_world(ivec2(block_coord.x + 1, block_coord.y));
+        block_data_top = fetch_world(ivec2(block_coord.x, block_coord.y + 1));
+        block_data_bottom = fetch_world(ivec2(block_coord.x, block_coord.y - 1));
 
         block_type = block_data.r;
         block_type_left = block_data_left.r;
@@ -566,18 +583,20 @@ vec4 get_color_foreground() {
     }
     
     // Skip water
-    if (block_type == 0 && abs(block_data.a) < 1) {
+    ivec4 water_data = fetch_water(block_coord);
+    int water_flags = water_data.r;
+    if (water_flags == 0) {
         return mix_overlay_color(block_color, overlay_color_add, overlay_color_sub);
     }
 
     // Draw water
-    float water_level = block_data.a / WATER_PER_BLOCK;
-    float water_level_top = abs(block_data_top.a / WATER_PER_BLOCK);
-    float water_level_bottom = abs(block_data_bottom.a / WATER_PER_BLOCK);
-    float water_level_left = abs(block_data_left.a / WATER_PER_BLOCK);
-    float water_level_right = abs(block_data_right.a / WATER_PER_BLOCK);
-    float water_level_top_left = abs(texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y + 1), 0).a / WATER_PER_BLOCK);
-    float water_level_top_right = abs(texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y + 1), 0).a / WATER_PER_BLOCK);
+    float water_level = water_data.g / WATER_PER_BLOCK;
+    float width = water_data.b / WATER_PER_BLOCK;
+    float height = water_data.a / WATER_PER_BLOCK;
+    int water_side = 1;
+    if ((water_flags & water_flag.side) != 0) {
+        water_side = -1;
+    }
 
     water_color = get_color_block(block.water, water_source_pixel);
     water_color.a = 0.5;
@@ -585,115 +604,61 @@ vec4 get_color_foreground() {
 
     fsource_pixel.y -= 1 / float(BLOCK_SIZE_SOURCE);
 
-    int water_side = 1;
-    if (water_level < 0) {
-        water_side = -1;
-        water_level = abs(water_level);                
+    if ((water_flags & water_flag.full) != 0) {
+        // Covered water
+        return water_color;
     }
 
-    if (water_level_top > BORDER_THRESHOLD && (water_level_left > 1.0 - BORDER_THRESHOLD || water_level_right > 1.0 - BORDER_THRESHOLD)) {
-        water_level = 1.0;
-    } else if (water_level_left > 1.0 - BORDER_THRESHOLD && water_level_right > 1.0 - BORDER_THRESHOLD) {
-        water_level = 1.0;
-    } else if (water_level_top > BORDER_THRESHOLD && water_level_top > water_level && block_type == 0) {
-        water_level = water_level_top;
-    }
-    
-    if (water_level > 0.1 && block_type == 0) {
-        int draw_water = 0;
-        int vertical = 0;
-        int horizontal = 0;
-        int covered = 0;
-        int corner = 0;
-        float width = min((water_level + water_level_top) * 0.5, 0.2);
-        float height = 1.0;
-
-        // Get water state
-        water_level = max(max(water_level, water_level_left), water_level_right);
-        if (water_level_top > BORDER_THRESHOLD && water_level_top_left > 0.1 && water_level_top_right > 0.1) {
-            // Covered water
+    // Draw vertical water
+    if ((water_flags & water_flag.falling) != 0 && abs((water_side + 1) / 2 - fsource_pixel.x) <= width && fsource_pixel.y <= height) {
+        return water_color;
+    } else if ((water_flags & water_flag.corner) != 0 && water_side == -1) {
+        if (fsource_pixel.x + fsource_pixel.y <= (width + height) / 2 && fsource_pixel.x <= width && fsource_pixel.y <= height) {
             return water_color;
-        } else if ((block_type_bottom != 0 || water_level_bottom > 0.9) && water_level_top > 0.1) {
-            // Vertical & horizontal water
-            vertical = 1;
-            horizontal = 1;
-        } else if (block_type_bottom == 0 && water_level_top > 0.1 && (water_level_left < BORDER_THRESHOLD || water_level_right < BORDER_THRESHOLD)) {
-            // Vertical water
-            vertical = 1;
-        } else if (block_type_bottom == 0 && water_level_top > 0.1 && (water_level_left > BORDER_THRESHOLD && water_level_right > BORDER_THRESHOLD)) {
-            // Covered vertical water
-            return water_color;
-        } else if (block_type_bottom == 0 && water_level_top <= 0.1 && (water_level_left < BORDER_THRESHOLD && water_level_right < BORDER_THRESHOLD)) {
-            // Top of vertical water
-            vertical = 1;
-            height = water_level;
-            width = min(water_level, 0.2);
-        } else if (block_type_bottom == 0 && water_level_top < BORDER_THRESHOLD && water_level_bottom < 1.0 - BORDER_THRESHOLD && (water_level_left < BORDER_THRESHOLD && water_level_right > BORDER_THRESHOLD || water_level_right < BORDER_THRESHOLD && water_level_left > BORDER_THRESHOLD)) {
-            // Corner of vertical water and horizontal on one side
-            corner = 1;
-            width = min(water_level, 0.2);
-        } else {
-            // Horizontal water
-            horizontal = 1;
         }
-
-        // Draw vertical water
-        if (vertical == 1 && abs((water_side + 1) / 2 - fsource_pixel.x) <= width && fsource_pixel.y <= height) {
+    } else if ((water_flags & water_flag.corner) != 0 && water_side == 1) {
+        if (abs((water_side + 1) / 2 - fsource_pixel.x) + fsource_pixel.y <= (width + height) / 2 && 1.0 - fsource_pixel.x <= width && fsource_pixel.y <= height) {
             return water_color;
-        } else if (corner == 1 && water_side == -1) {
-            height = water_level_left;
-
-            if (fsource_pixel.x + fsource_pixel.y <= (width + height) / 2 && fsource_pixel.x <= width && fsource_pixel.y <= height) {
-                return water_color;
-            }
-        } else if (corner == 1 && water_side == 1) {
-            height = water_level_right;                    
-
-            if (abs((water_side + 1) / 2 - fsource_pixel.x) + fsource_pixel.y <= (width + height) / 2 && 1.0 - fsource_pixel.x <= width && fsource_pixel.y <= height) {
-                return water_color;
-            }
         }
+    }
 
-        // Draw horizontal water
-        if (horizontal == 1) {
-            if (false && water_level_top > BORDER_THRESHOLD && vertical == 0 || water_level > 1.0 - BORDER_THRESHOLD || water_level_top > 0.1 && water_level_top_left > 0.1 && water_level_left > 1.0 - BORDER_THRESHOLD * 10 || water_level_top > 0.1 && water_level_top_right > 0.1 && water_level_right > 1.0 - BORDER_THRESHOLD * 10) {
-                return water_color;
-            } else {
-                // Wave amplitude
-                if (block_type_left == 0) {
-                    amplitude_left = 1.0;
-                }
-                if (block_type_right == 0) {
-                    amplitude_right = 1.0;
-                }
-                amplitude = mix(amplitude_left, amplitude_right, fsource_pixel.x);
-
-                // Wave offset
-                float wave_x = int(gl_FragCoord / resolution + camera.x * BLOCK_SIZE_SOURCE) * WAVE_FREQUENCY;
-                float wave_offset = amplitude * (WAVE_AMPLITUDE * sin(wave_x)
-                                    + WAVE_AMPLITUDE * cos(wave_x * 0.5 + 5.0) * 0.8
-                                    + WAVE_AMPLITUDE * sin(wave_x * 0.25 + 10.0) * 0.5);
-
-                // Interpolate final water level
-                if (block_type_left > 0) {
-                    water_level_left = water_level;
-                }
-                if (block_type_right > 0) {
-                    water_level_right = water_level;
-                }
-                int final_water_level = int(mix(mix(water_level, water_level_left, 0.5), mix(water_level, water_level_right, 0.5), fsource_pixel.x) * BLOCK_SIZE_SOURCE);
+    // Draw horizontal water
+    if ((water_flags & water_flag.surface) != 0) {
+        // Wave amplitude
+        if (block_type_left == 0) {
+            amplitude_left = 1.0;
+        }
+        if (block_type_right == 0) {
+            amplitude_right = 1.0;
+        }
+        amplitude = mix(amplitude_left, amplitude_right, fsource_pixel.x);
+
+        // Wave offset
+        float wave_x = int(gl_FragCoord / resolution + camera.x * BLOCK_SIZE_SOURCE) * WAVE_FREQUENCY;
+        float wave_offset = amplitude * (WAVE_AMPLITUDE * sin(wave_x)
+                            + WAVE_AMPLITUDE * cos(wave_x * 0.5 + 5.0) * 0.8
+                            + WAVE_AMPLITUDE * sin(wave_x * 0.25 + 10.0) * 0.5);
+
+        // Interpolate final water level
+        float water_level_left = abs(block_data_left.a / WATER_PER_BLOCK);
+        float water_level_right = abs(block_data_right.a / WATER_PER_BLOCK);
+        if (block_type_left > 0) {
+            water_level_left = water_level;
+        }
+        if (block_type_right > 0) {
+            water_level_right = water_level;
+        }
+        int final_water_level = int(mix(mix(water_level, water_level_left, 0.5), mix(water_level, water_level_right, 0.5), fsource_pixel.x) * BLOCK_SIZE_SOURCE);
 
-                // Add wave offset
-                if (wave_offset + sin(time) * 0.08 > 0.03) {
-                    final_water_level += 1;
-                } else if (wave_offset + sin(time) * 0.08 < -0.03) {
-                    final_water_level -= 1;
-                }
+        // Add wave offset
+        if (wave_offset + sin(time) * 0.08 > 0.03) {
+            final_water_level += 1;
+        } else if (wave_offset + sin(time) * 0.08 < -0.03) {
+            final_water_level -= 1;
+        }
 
-                if (source_pixel.y - 1 < final_water_level) {
-                    return water_color;
-                }
-            }
+        if (source_pixel.y - 1 < final_water_level) {
+            return water_color;
         }
     }
     return mix_overlay_color(block_color, overlay_color_add, overlay_color_sub);
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Headless water benchmark: loads structures from data/structures into a water plane and runs water steps on it.
+Reports ticks per second, the drift of the total water volume and the number of changed cells per tick.
+Only needs numpy and numba (no pygame or OpenGL).
+
+With --world, the structures are placed into a World and stepped through its snapshot and apply path,
+with the view step on the worker thread and the ring steps around it. This imports the game modules, so it needs pygame
+(but no display or OpenGL context).
+
+    python experimental/benchmark/water_benchmark.py pond0 flooded_cave0 flooded_cave1 --ticks 500 --kernel compiled
+    python experimental/benchmark/water_benchmark.py --world
+"""
+import argparse
+import random
+import time
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from scripts.utility.const import *
+from scripts.game import water
+
+
+STRUCTURE_FOLDER: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "structures")
+
+
+def load_structure(name: str):
+    """
+    Returns the water levels and solid mask of a structure, placed in a chunk-aligned plane surrounded by solid blocks.
+    """
+    array = numpy.load(os.path.join(STRUCTURE_FOLDER, name, name + ".npy"))
+    width = (array.shape[0] // WORLD_CHUNK_SIZE + 2) * WORLD_CHUNK_SIZE
+    height = (array.shape[1] // WORLD_CHUNK_SIZE + 2) * WORLD_CHUNK_SIZE
+    offset_x = (width - array.shape[0]) // 2
+    offset_y = (height - array.shape[1]) // 2
+
+    water_level = numpy.zeros((width, height), dtype=numpy.int32)
+    solid = numpy.ones((width, height), dtype=bool)
+    water_level[offset_x:offset_x + array.shape[0], offset_y:offset_y + array.shape[1]] = numpy.abs(array[:, :, 3])
+    solid[offset_x:offset_x + array.shape[0], offset_y:offset_y + array.shape[1]] = array[:, :, 0] != 0
+    return water_level, solid
+
+
+def run(name: str, ticks: int, kernel, pour: float):
+    water_level, solid = load_structure(name)
+
+    # Pour water into random air blocks, so the structure does not start settled
+    for x, y in numpy.argwhere(~solid):
+        if random.random() < pour:
+            water_level[x, y] += WORLD_WATER_PER_BLOCK
+
+    chunks_shape = (water_level.shape[0] // WORLD_CHUNK_SIZE, water_level.shape[1] // WORLD_CHUNK_SIZE)
+    active_chunks = numpy.ones(chunks_shape, dtype=bool)
+    start_volume = int(water_level.sum())
+    changed_cells = 0
+    settled_tick = None
+
+    kernel(water_level, solid) # compile
+    start_time = time.perf_counter()
+    for tick in range(ticks):
+        active = numpy.repeat(numpy.repeat(active_chunks, WORLD_CHUNK_SIZE, axis=0), WORLD_CHUNK_SIZE, axis=1)
+        active[[0, -1], :] = active[:, [0, -1]] = False
+        new_water_level, water_side = kernel(water_level, solid, active)
+        changed = new_water_level != water_level
+        water_level = new_water_level
+
+        # Sleep chunks, in which no water changed; wake neighbours of changed blocks
+        changed_count = int(changed.sum())
+        changed_cells += changed_count
+        if not changed_count and settled_tick is None:
+            settled_tick = tick
+        near_changed = changed.copy()
+        near_changed[1:] |= changed[:-1]
+        near_changed[:-1] |= changed[1:]
+        near_changed[:, 1:] |= changed[:, :-1]
+        near_changed[:, :-1] |= changed[:, 1:]
+        active_chunks = near_changed.reshape(chunks_shape[0], WORLD_CHUNK_SIZE, chunks_shape[1], WORLD_CHUNK_SIZE).any(axis=(1, 3))
+    duration = time.perf_counter() - start_time
+
+    end_volume = int(water_level.sum())
+    print(
+        f"{name:16} {water_level.shape[0]:4}x{water_level.shape[1]:<4}"
+        f" {ticks / duration:10.1f} ticks/s"
+        f"   volume {start_volume} -> {end_volume} (drift {end_volume - start_volume:+})"
+        f"   {changed_cells / ticks:8.1f} changed/tick"
+        f"   settled at tick {settled_tick}"
+    )
+    return end_volume == start_volume
+
+
+def run_world(name: str, ticks: int, pour: float):
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.chdir(os.sep) # file.find joins relative game folders without the leading separator on Linux
+    from scripts.graphics import image
+    from scripts.game.world import World
+    from scripts.game import structure
+    image.CREATE_TEXTURE_ATLAS_FILE = False
+
+    *block_data, atlas = image.load_blocks()
+    world = World(*block_data)
+    array = structure.load(world.block_name)[name]["array"]
+
+    # Place the structure into a chunk-aligned plane surrounded by dirt
+    width = (array.shape[0] // WORLD_CHUNK_SIZE + 2) * WORLD_CHUNK_SIZE
+    height = (array.shape[1] // WORLD_CHUNK_SIZE + 2) * WORLD_CHUNK_SIZE
+    offset_x = (width - array.shape[0]) // 2
+    offset_y = (height - array.shape[1]) // 2
+    data = numpy.zeros((width, height, 4), dtype=WORLD_CHUNK_DTYPE)
+    data[:, :, 0] = world.block_name["dirt_block"]
+    data[offset_x:offset_x + array.shape[0], offset_y:offset_y + array.shape[1]] = array
+    air = data[:, :, 0] == 0
+    pour_mask = air & (numpy.random.default_rng(random.randrange(2 ** 32)).random(air.shape) < pour)
+    data[:, :, 3] = numpy.where(pour_mask, numpy.abs(data[:, :, 3].astype(numpy.int32)) + WORLD_WATER_PER_BLOCK, data[:, :, 3])
+    world.set_region(0, 0, data, layer=slice(None))
+
+    # The left half of the plane is the view, the rest is stepped by the ring around it
+    world.loaded_blocks = ((0, 0), ((width // WORLD_CHUNK_SIZE // 2 or 1) * WORLD_CHUNK_SIZE, height))
+    window = type("Window", (), {"options": {"particles": False, "simulation distance": 100}})()
+
+    def water_levels():
+        return numpy.abs(world.get_region(0, 0, width, height, layer=3).astype(numpy.int32))
+
+    start_volume = int(water_levels().sum())
+    changed_cells = 0
+    settled_tick = None
+
+    start_time = time.perf_counter()
+    for tick in range(ticks):
+        water_level = water_levels()
+        world.update_blocks(window)
+        world.update_water_ring(window, WORLD_WATER_RING_INTERVAL)
+        changed_count = int((water_levels() != water_level).sum())
+        changed_cells += changed_count
+        if not changed_count and settled_tick is None and world.water_job is None and not world.water_ring_jobs:
+            settled_tick = tick
+    world.wait_water()
+    duration = time.perf_counter() - start_time
+
+    end_volume = int(water_levels().sum())
+    print(
+        f"{name:16} {width:4}x{height:<4}"
+        f" {ticks / duration:10.1f} ticks/s"
+        f"   volume {start_volume} -> {end_volume} (drift {end_volume - start_volume:+})"
+        f"   {changed_cells / ticks:8.1f} changed/tick"
+        f"   settled at tick {settled_tick}"
+        f"   clamped {world.water_clamped}"
+    )
+    return end_volume == start_volume and not world.water_clamped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the water simulation on structures.")
+    parser.add_argument("structures", nargs="*", default=["pond0", "flooded_cave0", "flooded_cave1"])
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--kernel", choices=("compiled", "array"), default="compiled")
+    parser.add_argument("--pour", type=float, default=0.1, help="fraction of air blocks filled with water at the start")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--world", action="store_true", help="step the structures through World (the kernel is always the compiled one)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.world:
+        conserved = [run_world(name, args.ticks, args.pour) for name in args.structures]
+    else:
+        kernel = water.step_compiled if args.kernel == "compiled" else water.step
+        conserved = [run(name, args.ticks, kernel, args.pour) for name in args.structures]
+    if not all(conserved):
+        print("Water volume is not conserved or overlapping steps were clamped")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
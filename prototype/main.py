@@ -412,7 +412,9 @@ async def main():
             if world.player.health <= 0:
                 world.player.state = "idle"
                 world.player.inventory.save(world)
-                file.delete("data/user/world.data")
+                world.wait_autosave()
+                file.delete(WORLD_SAVE_HEADER)
+                file.delete(WORLD_SAVE_FOLDER)
                 menu.death_page.open()
                 menu.game_state = "death"
                 sound.play(window, "damage", channel_volume=2)
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from scripts.utility.noise_functions import pnoise1, snoise2
+from scripts.utility.noise_functions import pnoise1, snoise2, pnoise1_array
 from scripts.utility.const import *
 
 
@@ -21,56 +21,128 @@ def generate_points_segment(position: [float], length, start_angle: float, devia
     return points
 
 
-def line_cave(world, position, length, angle, deviation, radius):
-    points = generate_points_segment(position, length, angle, deviation)
+stamps: dict = {} # {(shape, radius): (offsets, air, air_x, air_y)} -> cached carving stamps
+
+
+def get_stamp(shape: str, radius: int):
+    """
+    Returns the stamp carved around a point: the offsets of a square of radius plus WORLD_GENERATION_CAVE_BORDER_PADDING,
+    the mask of its air blocks and the indices of the air blocks along both axes.
+    shape: "circle", "ellipse" (stretched vertically) or "blob" (flat top, round bottom)
+    """
+    key = (shape, radius)
+    if not key in stamps:
+        offsets = numpy.arange(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1)
+        delta_x = offsets[:, None]
+        delta_y = offsets[None, :]
+        if shape == "circle":
+            air = delta_x ** 2 + delta_y ** 2 <= radius ** 2
+        elif shape == "ellipse":
+            air = delta_x ** 2 + (delta_y * 0.5) ** 2 <= radius ** 2
+        elif shape == "blob":
+            air = (delta_y > 0) & (delta_x ** 2 + (delta_y * 0.8) ** 2 <= radius ** 2) | (delta_x ** 2 + (delta_y * 2) ** 2 <= radius ** 2)
+        else:
+            raise ValueError(f"Unknown stamp shape: {shape}")
+        stamps[key] = (offsets, air, *numpy.nonzero(air))
+    return stamps[key]
+
+
+def carve(world, points: list, shape: str="circle", padding: bool=True):
+    """
+    Carve the stamps of points [(x, y, radius)] into the world with a single masked write.
+    If padding is set, the missing chunks of the padding square around each point are created, which generates them as dirt.
+    Chunks are created in the same order as by carving the points block by block.
+    """
+    cells_x = []
+    cells_y = []
+    for x, y, radius in points:
+        offsets, air, air_x, air_y = get_stamp(shape, radius)
+        if not len(offsets):
+            continue
+        # Offsets are rounded towards zero, like int()
+        blocks_x = numpy.trunc(x + offsets).astype(int)
+        blocks_y = numpy.trunc(y + offsets).astype(int)
+        cells_x.append(blocks_x[air_x])
+        cells_y.append(blocks_y[air_y])
+
+        if padding:
+            for chunk_x in range(int(blocks_x[0]) >> WORLD_CHUNK_SIZE_POWER, (int(blocks_x[-1]) >> WORLD_CHUNK_SIZE_POWER) + 1):
+                for chunk_y in range(int(blocks_y[0]) >> WORLD_CHUNK_SIZE_POWER, (int(blocks_y[-1]) >> WORLD_CHUNK_SIZE_POWER) + 1):
+                    if not (chunk_x, chunk_y) in world.chunks:
+                        world.create_chunk(chunk_x, chunk_y)
+        else:
+            create_chunks(world, cells_x[-1], cells_y[-1])
+
+    if cells_x:
+        set_air(world, numpy.concatenate(cells_x), numpy.concatenate(cells_y))
+
+
+def create_chunks(world, cells_x: numpy.array, cells_y: numpy.array):
+    """
+    Create the missing chunks of blocks, in the order in which the blocks are given.
+    """
+    if not len(cells_x):
+        return
+    chunks, first = numpy.unique(
+        numpy.stack((cells_x >> WORLD_CHUNK_SIZE_POWER, cells_y >> WORLD_CHUNK_SIZE_POWER), axis=1),
+        axis=0, return_index=True
+    )
+    for chunk_x, chunk_y in chunks[numpy.argsort(first)].tolist():
+        if not (chunk_x, chunk_y) in world.chunks:
+            world.create_chunk(chunk_x, chunk_y)
+
+
+def set_air(world, cells_x: numpy.array, cells_y: numpy.array):
+    """
+    Replace the foreground blocks at the given coordinates with air.
+    """
+    if not len(cells_x):
+        return
+    start_x = cells_x.min()
+    start_y = cells_y.min()
+    mask = numpy.zeros((cells_x.max() - start_x + 1, cells_y.max() - start_y + 1), dtype=bool)
+    mask[cells_x - start_x, cells_y - start_y] = True
+    world.set_region(int(start_x), int(start_y), numpy.zeros(mask.shape, dtype=WORLD_CHUNK_DTYPE), layer=0, mask=mask)
+
 
-    for (x, y) in points:
-        p_radius = int(pnoise1((x + y) / 2 + 100, octaves=3) * 2 + radius)
-        for delta_x in range(-p_radius - WORLD_GENERATION_CAVE_BORDER_PADDING, p_radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-            for delta_y in range(-p_radius - WORLD_GENERATION_CAVE_BORDER_PADDING, p_radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-                coord = (int(x + delta_x), int(y + delta_y))
-                if delta_x ** 2 + delta_y ** 2 <= p_radius ** 2:
-                    world.set_block(*coord, 0)
-                elif not world.get_block_exists(*coord):
-                    world.set_block(*coord, world.block_name["dirt_block"])
+def line_cave(world, position, length, angle, deviation, radius):
+    points = list(generate_points_segment(position, length, angle, deviation))
+    radii = (pnoise1_array([(x + y) / 2 + 100 for (x, y) in points], octaves=3) * 2 + radius).astype(int)
+    carve(world, [(x, y, point_radius) for (x, y), point_radius in zip(points, radii.tolist())])
 
 
 # Called from generate_world
 def intro(world, window, position):
     surface_size = (80, 50)
-    for x in range(-surface_size[0], surface_size[0] + 1):
-        surface_level = pnoise1(x / 20 + world.seed, octaves=3) * 9
-        for y in range(-surface_size[0], surface_size[0] + 1):
-            if surface_level < y:
-                world.set_block(x, y, 0)
+    surface_x = numpy.arange(-surface_size[0], surface_size[0] + 1)
+    surface_y = numpy.arange(-surface_size[0], surface_size[0] + 1)
+    surface_level = pnoise1_array(surface_x / 20 + world.seed, octaves=3) * 9
+    air_x, air_y = numpy.nonzero(surface_level[:, None] < surface_y[None, :])
+    create_chunks(world, surface_x[air_x], surface_y[air_y])
+    set_air(world, surface_x[air_x], surface_y[air_y])
             
     window.loading_progress[1] = 2
 
-    points = set()
     start_angle = angle = -pi/2
     length = INTRO_LENGTH
     deviation = 5
     lowest = 0
 
-    for i in range(length):
-        position[0] = pnoise1(i * 16 + world.seed, octaves=2, repeat=INTRO_REPEAT * 16) * deviation
-        position[1] = -i
-        points.add(tuple(position))
+    points_x = pnoise1_array(numpy.arange(length) * 16 + world.seed, octaves=2, repeat=INTRO_REPEAT * 16) * deviation
+    points = set(zip(points_x.tolist(), range(0, -length, -1)))
+    position[0] = float(points_x[-1])
 
     window.loading_progress[1] = 3
 
-    for (x, y) in points:
-        radius = int((pnoise1(y + world.seed, octaves=3, repeat=INTRO_REPEAT) + 2) * 2)
-        for delta_x in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-            for delta_y in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-                coord = (int(x + delta_x), int(y + delta_y))
-                if delta_x ** 2 + (delta_y * 0.5) ** 2 <= radius ** 2:
-                    world.set_block(*coord, 0)
-                    if y + delta_y < lowest:
-                        lowest = y + delta_y
-                elif not world.get_block_exists(*coord):
-                    world.set_block(*coord, world.block_name["dirt_block"])
-    position[1] = lowest
+    points = list(points)
+    radii = ((pnoise1_array([y + world.seed for (x, y) in points], octaves=3, repeat=INTRO_REPEAT) + 2) * 2).astype(int)
+    points = [(x, y, radius) for (x, y), radius in zip(points, radii.tolist())]
+    carve(world, points, "ellipse")
+    for x, y, radius in points:
+        offsets, air, air_x, air_y = get_stamp("ellipse", radius)
+        if len(air_y):
+            lowest = min(lowest, y + offsets[air_y.min()])
+    position[1] = int(lowest)
     
 
 def horizontal(world, position):
@@ -92,6 +164,7 @@ def interpolated(world, position, start_angle=None, end_angle=None, start_radius
     if end_radius is None:
         end_radius = int(pnoise1((sum(position) + WORLD_GENERATION_INTERPOLATION_LENGTH * WORLD_GENERATION_STEP_SIZE) / 2 + 100, octaves=3) * 2 + WORLD_GENERATION_HORIZONTAL_CAVE_RADIUS)
 
+    points = []
     for i in range(WORLD_GENERATION_INTERPOLATION_LENGTH):
         interpolation = i / WORLD_GENERATION_INTERPOLATION_LENGTH
         angle = start_angle * (1 - interpolation) + end_angle * interpolation
@@ -99,14 +172,9 @@ def interpolated(world, position, start_angle=None, end_angle=None, start_radius
 
         x = position[0] = position[0] + cos(angle) * WORLD_GENERATION_STEP_SIZE
         y = position[1] = position[1] + sin(angle) * WORLD_GENERATION_STEP_SIZE
+        points.append((x, y, radius))
 
-        for delta_x in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-            for delta_y in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-                coord = (int(x + delta_x), int(y + delta_y))
-                if delta_x ** 2 + delta_y ** 2 <= radius ** 2:
-                    world.set_block(*coord, 0)
-                elif not world.get_block_exists(*coord):
-                    world.set_block(*coord, world.block_name["dirt_block"])
+    carve(world, points)
 
 
 def vertical(world, position):
@@ -120,10 +188,4 @@ def vertical(world, position):
 
 def blob(world, position):
     radius = int((pnoise1(position[0] + world.seed, octaves=3) + 3) * 3)
-    for delta_x in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-        for delta_y in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-            coord = (int(position[0] + delta_x), int(position[1] + delta_y))
-            if delta_y > 0 and delta_x ** 2 + (delta_y * 0.8) ** 2 <= radius ** 2:
-                world.set_block(*coord, 0)
-            elif delta_x ** 2 + (delta_y * 2) ** 2 <= radius ** 2:
-                world.set_block(*coord, 0)
+    carve(world, [(position[0], position[1], radius)], "blob", padding=False)
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+from scripts.utility.const import *
+from collections import OrderedDict
+import threading
+import tempfile
+import pickle
+import zlib
+
+
+CHUNK_SHAPE: tuple = (WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE, 4)
+CHUNK_PALETTE_SIZE: int = 256
+
+
+class Chunk:
+    """
+    Block data of a chunk: (block, plant, background, water_level) for each block.
+    A chunk is stored in one of three ways:
+     - uniform: a single value per layer. The array is created on the first write, which breaks uniformity.
+     - palette: uint8 indices into a per-chunk palette of block ids and a separate water plane (if there is water).
+       Bulk reads are gathered from the palette, single block reads and writes decode the chunk.
+     - array: int16 array of shape CHUNK_SHAPE.
+    Indexing works like on a numpy array of shape CHUNK_SHAPE.
+    """
+    __slots__ = ("value", "array", "palette", "indices", "water", "_broadcast")
+
+    def __init__(self, value=(0, 0, 0, 0), array: numpy.array=None):
+        self.value: numpy.array = None # Layer values of a uniform chunk
+        self.array: numpy.array = None # Block data of a decoded chunk
+        self.palette: numpy.array = None # Block ids of a palette chunk
+        self.indices: numpy.array = None # Palette indices of the block, plant and background layer
+        self.water: numpy.array = None # Water levels of a palette chunk (None if there is no water)
+        self._broadcast: numpy.array = None # Read-only view of value with the shape of a chunk
+
+        if array is None:
+            self._set_uniform(value)
+        else:
+            self.array = numpy.asarray(array, dtype=WORLD_CHUNK_DTYPE)
+
+    def __getitem__(self, key):
+        if not self.array is None:
+            return self.array[key]
+        if not self.value is None:
+            return self._broadcast[key]
+        if isinstance(key, tuple) and all(isinstance(index, slice) for index in key):
+            return self._gather(*key)
+        self.materialize()
+        return self.array[key]
+
+    def __setitem__(self, key, value):
+        if self.array is None:
+            if not self.value is None and numpy.all(self._broadcast[key] == value):
+                return
+            self.materialize()
+        self.array[key] = value
+
+    def __getstate__(self):
+        return self.value, self.array, self.palette, self.indices, self.water
+
+    def __setstate__(self, state):
+        self.value, self.array, self.palette, self.indices, self.water = state
+        self._broadcast = None
+        if not self.value is None:
+            self._set_uniform(self.value)
+
+    @property
+    def uniform(self):
+        return not self.value is None
+
+    def _set_uniform(self, value):
+        self.value = numpy.array(value, dtype=WORLD_CHUNK_DTYPE)
+        self._broadcast = numpy.broadcast_to(self.value, CHUNK_SHAPE)
+
+    def _gather(self, x_key: slice, y_key: slice=slice(None), layer_key: slice=slice(None)):
+        """
+        Decode a rect of a palette chunk without decoding the whole chunk.
+        """
+        blocks = self.palette[self.indices[x_key, y_key]]
+        data = numpy.empty((*blocks.shape[:2], 4), dtype=WORLD_CHUNK_DTYPE)
+        data[:, :, :3] = blocks
+        if self.water is None:
+            data[:, :, 3] = 0
+        else:
+            data[:, :, 3] = self.water[x_key, y_key]
+        return data[:, :, layer_key]
+
+    def materialize(self):
+        """
+        Create the array of a uniform or palette chunk.
+        """
+        if not self.array is None:
+            return
+
+        if self.value is None:
+            array = self._gather(slice(None))
+        else:
+            array = numpy.empty(CHUNK_SHAPE, dtype=WORLD_CHUNK_DTYPE)
+            array[:] = self.value
+
+        self.array = array
+        self.value = self.palette = self.indices = self.water = self._broadcast = None
+
+    def compress(self):
+        """
+        Drop the array if all blocks are equal or encode it with a palette.
+        """
+        if self.array is None:
+            return
+
+        value = self.array[0, 0]
+        if numpy.all(self.array == value):
+            self._set_uniform(value)
+            self.array = None
+            return
+
+        if not WORLD_CHUNK_PALETTE:
+            return
+
+        palette, indices = numpy.unique(self.array[:, :, :3], return_inverse=True)
+        if len(palette) > CHUNK_PALETTE_SIZE:
+            return
+
+        self.palette = palette
+        self.indices = indices.reshape((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE, 3)).astype(numpy.uint8)
+        if numpy.any(self.array[:, :, 3]):
+            self.water = self.array[:, :, 3].copy()
+        self.array = None
+
+
+class ChunkManager:
+    """
+    Dict-like container of all chunks {(chunk_x, chunk_y): Chunk}, which keeps at most budget chunks in memory.
+    Least recently used chunks outside of the focus rect are compressed and written to an append-only swap file,
+    accessing them pages them back in. Chunks ahead of the focus movement are prefetched.
+    Chunks of a loaded save are read from its chunk file on demand.
+    """
+    def __init__(self, budget: int=WORLD_CHUNK_BUDGET):
+        self.budget: int = budget
+        self.coords: dict = {} # {(chunk_x, chunk_y): None} -> all chunks in creation order
+        self.resident: OrderedDict = OrderedDict() # {(chunk_x, chunk_y): Chunk} -> chunks in memory, least recently used first
+        self.modified: set = set() # resident chunks, which differ from their stored copy
+        self.unsaved: set = set() # chunks, which differ from their copy in the chunk file
+        self.focus: tuple = ((0, 0), (-1, -1)) # chunk rect, which is never evicted
+        self.direction: tuple = (0, 0) # last movement of the focus rect
+        self._init_files()
+
+    def _init_files(self):
+        self.swap_index: dict = {} # {(chunk_x, chunk_y): (offset, length)} -> chunks in the swap file
+        self.swap_size: int = 0 # bytes written to the swap file
+        self.swap_used: int = 0 # bytes of chunks in the swap index
+        self._swap = None # temporary file, created on the first eviction
+        self.base_path: str = None # chunk file of the save
+        self.base_index: dict = {} # {(chunk_x, chunk_y): (offset, length)} -> chunks in the chunk file
+        self.base_size: int = 0
+        self.base_used: int = 0
+        self._base = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, coord):
+        return coord in self.coords
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __iter__(self):
+        return iter(list(self.coords))
+
+    def __getitem__(self, coord):
+        chunk = self.resident.get(coord)
+        if chunk is None:
+            if not coord in self.coords:
+                raise KeyError(coord)
+            return self._page_in(coord)
+        self.resident.move_to_end(coord)
+        return chunk
+
+    def __setitem__(self, coord, chunk):
+        self.coords[coord] = None
+        self.resident[coord] = chunk
+        self.resident.move_to_end(coord)
+        self.mark_modified(coord)
+        if len(self.resident) > self.budget:
+            self._evict()
+
+    def get(self, coord, default=None):
+        if coord in self.coords:
+            return self[coord]
+        return default
+
+    def keys(self):
+        return list(self.coords)
+
+    def items(self):
+        """
+        Iterate over all chunks. Stored chunks are paged in one at a time.
+        """
+        for coord in list(self.coords):
+            yield coord, self[coord]
+
+    def values(self):
+        for coord, chunk in self.items():
+            yield chunk
+
+    def mark_modified(self, coord: tuple):
+        self.modified.add(coord)
+        self.unsaved.add(coord)
+
+    def set_focus(self, start: tuple, end: tuple):
+        """
+        Protect the chunk rect [start, end] from eviction and prefetch chunks in the direction it moved.
+        """
+        (start_x, start_y), (end_x, end_y) = start, end
+        shift_x = start_x - self.focus[0][0]
+        shift_y = start_y - self.focus[0][1]
+        if shift_x or shift_y:
+            self.direction = ((shift_x > 0) - (shift_x < 0), (shift_y > 0) - (shift_y < 0))
+
+        # Extend the rect by the prefetch distance in the direction of movement
+        start_x += min(0, self.direction[0]) * WORLD_CHUNK_PREFETCH_DISTANCE
+        start_y += min(0, self.direction[1]) * WORLD_CHUNK_PREFETCH_DISTANCE
+        end_x += max(0, self.direction[0]) * WORLD_CHUNK_PREFETCH_DISTANCE
+        end_y += max(0, self.direction[1]) * WORLD_CHUNK_PREFETCH_DISTANCE
+        self.focus = ((start_x, start_y), (end_x, end_y))
+
+        if len(self.resident) == len(self.coords):
+            return
+        prefetched = 0
+        for chunk_x in range(start_x, end_x + 1):
+            for chunk_y in range(start_y, end_y + 1):
+                if (chunk_x, chunk_y) in self.coords and not (chunk_x, chunk_y) in self.resident:
+                    self._page_in((chunk_x, chunk_y))
+                    prefetched += 1
+                    if prefetched >= WORLD_CHUNK_PREFETCH_LIMIT:
+                        return
+
+    def in_focus(self, coord: tuple):
+        (start_x, start_y), (end_x, end_y) = self.focus
+        return start_x <= coord[0] <= end_x and start_y <= coord[1] <= end_y
+
+    def _page_in(self, coord: tuple):
+        with self._lock:
+            chunk = pickle.loads(zlib.decompress(self._read(coord)))
+        self.resident[coord] = chunk
+        if len(self.resident) > self.budget:
+            self._evict()
+        return chunk
+
+    def _evict(self):
+        """
+        Write least recently used chunks to the swap file until the budget is met. The focus rect and the most recently used chunk are kept.
+        """
+        excess = len(self.resident) - self.budget
+        newest = next(reversed(self.resident))
+        evicted = []
+        for coord in self.resident:
+            if len(evicted) >= excess:
+                break
+            if coord != newest and not self.in_focus(coord):
+                evicted.append(coord)
+
+        with self._lock:
+            for coord in evicted:
+                chunk = self.resident.pop(coord)
+                if coord in self.modified or not self._stored(coord):
+                    chunk.compress()
+                    self._write_swap(coord, self._encode(chunk))
+                    self.modified.discard(coord)
+
+            if self.swap_size > 2 * self.swap_used + 2 ** 22:
+                self._compact_swap()
+
+    @staticmethod
+    def _encode(chunk: Chunk):
+        return zlib.compress(pickle.dumps(chunk, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+    def _stored(self, coord: tuple):
+        return coord in self.swap_index or coord in self.base_index
+
+    def _read(self, coord: tuple):
+        """
+        Read the latest stored copy of a chunk. The swap file holds newer copies than the chunk file.
+        """
+        if coord in self.swap_index:
+            offset, length = self.swap_index[coord]
+            self._swap.seek(offset)
+            return self._swap.read(length)
+        offset, length = self.base_index[coord]
+        self._base.seek(offset)
+        return self._base.read(length)
+
+    def _write_swap(self, coord: tuple, blob: bytes):
+        if self._swap is None:
+            self._swap = tempfile.TemporaryFile()
+        if coord in self.swap_index:
+            self.swap_used -= self.swap_index[coord][1]
+        self._swap.seek(self.swap_size)
+        self._swap.write(blob)
+        self.swap_index[coord] = (self.swap_size, len(blob))
+        self.swap_size += len(blob)
+        self.swap_used += len(blob)
+
+    def _compact_swap(self):
+        """
+        Rewrite the swap file without outdated copies of chunks.
+        """
+        blobs = {coord: self._read(coord) for coord in self.swap_index}
+        self._swap.close()
+        self.swap_index.clear()
+        self.swap_size = self.swap_used = 0
+        self._swap = None
+        for coord, blob in blobs.items():
+            self._write_swap(coord, blob)
+
+    def open(self, path: str, coords: list, index: dict):
+        """
+        Use the chunk file at path as storage of the chunks in index. Nothing is read until the chunks are accessed.
+        """
+        with self._lock:
+            self._base = open(path, "r+b")
+            self.base_path = path
+            self.base_index = dict(index)
+            self.base_size = os.path.getsize(path)
+            self.base_used = sum(length for offset, length in index.values())
+        self.coords = dict.fromkeys(coords)
+        self.resident.clear()
+        self.modified.clear()
+        self.unsaved.clear()
+
+    def collect(self, folder: str):
+        """
+        Encode the chunks changed since the last save and mark them as saved. All chunks are encoded, if the chunk file in folder
+        has to be rewritten because there is none yet or it mostly holds outdated copies. Returns (rewrite, coords, blobs) for write.
+        """
+        with self._lock:
+            rewrite = (
+                self._base is None
+                or os.path.dirname(self.base_path) != folder
+                or self.base_size > 2 * self.base_used + 2 ** 22
+            )
+            coords = list(self.coords) if rewrite else [coord for coord in self.coords if coord in self.unsaved]
+            blobs = {}
+            for coord in coords:
+                if coord in self.resident and (coord in self.modified or not self._stored(coord)):
+                    blobs[coord] = self._encode(self.resident[coord])
+                else:
+                    blobs[coord] = self._read(coord)
+            self.unsaved.clear()
+
+        return rewrite, list(self.coords), blobs
+
+    def write(self, folder: str, rewrite: bool, blobs: dict):
+        """
+        Append the blobs returned by collect to the chunk file and return (file name, index) for the header.
+        A rewritten chunk file gets a new name, the old one stays valid until the header referencing the new file is written.
+        Can be called from another thread.
+        """
+        with self._lock:
+            if rewrite:
+                if not self._base is None:
+                    self._base.close()
+                os.makedirs(folder, exist_ok=True)
+                number = 0
+                while os.path.exists(os.path.join(folder, "chunks%d.data" % number)):
+                    number += 1
+                self._base = open(os.path.join(folder, "chunks%d.data" % number), "w+b")
+                self.base_path = self._base.name
+                self.base_index.clear()
+                self.base_size = self.base_used = 0
+
+            self._base.seek(self.base_size)
+            for coord, blob in blobs.items():
+                if coord in self.base_index:
+                    self.base_used -= self.base_index[coord][1]
+                self._base.write(blob)
+                self.base_index[coord] = (self.base_size, len(blob))
+                self.base_size += len(blob)
+                self.base_used += len(blob)
+            self._base.flush()
+            os.fsync(self._base.fileno())
+
+            return os.path.basename(self.base_path), dict(self.base_index)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+from scripts.utility.const import *
+from concurrent.futures import ThreadPoolExecutor
+from numba import jit, prange
+import numba
+
+
+# Kernels are launched from the worker thread; TBB hangs on exit in that case
+numba.config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="water") # Runs all water steps, so kernel launches never overlap
+
+
+def step(water: numpy.array, solid: numpy.array, active: numpy.array=None):
+    """
+    Run one step of the water simulation on a region as array operations.
+    water: unsigned water levels of shape (width, height), y pointing up.
+    solid: bool array of the same shape; solid blocks don't receive water.
+    active: bool array of the cells, which emit water. Defaults to all but the border of the region,
+            so water can flow into the border, but not out of it.
+    Returns the new water levels (int32) and the flow side of each cell (-1 for water flowing right, 1 otherwise).
+    Water is only moved between cells, so the total amount is conserved.
+    """
+    water = water.astype(numpy.int32)
+    width, height = water.shape
+    unobstructed = ~solid
+    if active is None:
+        active = numpy.zeros(water.shape, dtype=bool)
+        active[1:-1, 1:-1] = True
+    active = active & (water > 0)
+
+    # Gravity: the cell below absorbs up to WORLD_WATER_PER_BLOCK plus a quarter of the overflow of the cell above
+    emittable = numpy.where(active, numpy.minimum(water // 2, WORLD_WATER_PER_BLOCK // 2), 0)
+    overflow = numpy.maximum(0, water - WORLD_WATER_PER_BLOCK) // 4
+    absorbed = numpy.zeros_like(water)
+    absorbed[:, 1:] = numpy.where(
+        unobstructed[:, :-1],
+        numpy.clip(WORLD_WATER_PER_BLOCK - water[:, :-1] + overflow[:, 1:], 0, emittable[:, 1:]),
+        0
+    )
+    water[:, 1:] -= absorbed[:, 1:]
+    water[:, :-1] += absorbed[:, 1:]
+    emittable -= absorbed
+
+    # Lateral equalization: water, which could not fall, is averaged with the side neighbours in pairs
+    inflow_side = numpy.zeros(water.shape, dtype=numpy.int8) # -1: received water from the left, 1: from the right
+    for parity in range(2):
+        left = slice(parity, width - 1, 2)
+        right = slice(parity + 1, width, 2)
+        difference = water[left] - water[right]
+        unobstructed_pair = unobstructed[left] & unobstructed[right]
+        transfer = numpy.where(
+            unobstructed_pair & (difference > 0) & (emittable[left] > 0),
+            difference // 2,
+            numpy.where(unobstructed_pair & (difference < 0) & (emittable[right] > 0), -(-difference // 2), 0)
+        )
+        water[left] -= transfer
+        water[right] += transfer
+        inflow_side[right][transfer > 0] = -1
+        inflow_side[left][transfer < 0] = 1
+
+    # Overflow: water above WORLD_WATER_PER_BLOCK rises into the cell above
+    excess = numpy.zeros_like(water)
+    excess[:, :-1] = numpy.where(active[:, :-1] & unobstructed[:, 1:], numpy.maximum(0, water[:, :-1] - WORLD_WATER_PER_BLOCK), 0)
+    water[:, :-1] -= excess[:, :-1]
+    water[:, 1:] += excess[:, :-1]
+
+    # Flow side: set on water, which moved right and is not covered by water
+    covered = numpy.zeros(water.shape, dtype=bool)
+    covered[:, :-1] = water[:, 1:] > 0
+    side = numpy.where((inflow_side == -1) & ~covered, -1, 1).astype(numpy.int32)
+
+    return water, side
+
+
+def step_compiled(water: numpy.array, solid: numpy.array, active: numpy.array=None):
+    """
+    Compiled version of step with the same arguments and results.
+    The gravity and overflow passes run in parallel over the columns, the lateral pass over the pairs of columns
+    of one parity and then the other, so neighbouring updates never race.
+    """
+    water = water.astype(numpy.int32)
+    if active is None:
+        active = numpy.zeros(water.shape, dtype=bool)
+        active[1:-1, 1:-1] = True
+    side = numpy.ones(water.shape, dtype=numpy.int32)
+    _step_compiled(water, numpy.ascontiguousarray(solid), active & (water > 0), side)
+    return water, side
+
+
+@jit(nopython=True, cache=True, parallel=True, nogil=True)
+def _step_compiled(water, solid, active, side):
+    width, height = water.shape
+    emittable = numpy.zeros((width, height), dtype=numpy.int32)
+    moved = numpy.zeros((width, height), dtype=numpy.int32)
+    inflow_side = numpy.zeros((width, height), dtype=numpy.int8)
+
+    # Gravity
+    for x in prange(width):
+        for y in range(height):
+            if active[x, y]:
+                emittable[x, y] = min(water[x, y] // 2, WORLD_WATER_PER_BLOCK // 2)
+        for y in range(1, height):
+            if not solid[x, y - 1]:
+                overflow = max(0, water[x, y] - WORLD_WATER_PER_BLOCK) // 4
+                moved[x, y] = min(max(WORLD_WATER_PER_BLOCK - water[x, y - 1] + overflow, 0), emittable[x, y])
+        for y in range(1, height):
+            water[x, y] -= moved[x, y]
+            water[x, y - 1] += moved[x, y]
+            emittable[x, y] -= moved[x, y]
+
+    # Lateral equalization
+    for parity in range(2):
+        for pair in prange((width - parity) // 2):
+            left = parity + pair * 2
+            right = left + 1
+            for y in range(height):
+                if solid[left, y] or solid[right, y]:
+                    continue
+                difference = water[left, y] - water[right, y]
+                if difference > 0 and emittable[left, y] > 0:
+                    transfer = difference // 2
+                elif difference < 0 and emittable[right, y] > 0:
+                    transfer = -(-difference // 2)
+                else:
+                    continue
+                water[left, y] -= transfer
+                water[right, y] += transfer
+                if transfer > 0:
+                    inflow_side[right, y] = -1
+                elif transfer < 0:
+                    inflow_side[left, y] = 1
+
+    # Overflow
+    for x in prange(width):
+        for y in range(height - 1):
+            moved[x, y] = 0
+            if active[x, y] and not solid[x, y + 1]:
+                moved[x, y] = max(0, water[x, y] - WORLD_WATER_PER_BLOCK)
+        for y in range(height - 1):
+            water[x, y] -= moved[x, y]
+            water[x, y + 1] += moved[x, y]
+
+        # Flow side
+        for y in range(height):
+            if inflow_side[x, y] == -1 and not (y < height - 1 and water[x, y + 1] > 0):
+                side[x, y] = -1
+
+
+def render_flags(blocks: numpy.array, water: numpy.array):
+    """
+    Classify water blocks for rendering, so the shader does not have to inspect the neighbours of each pixel.
+    blocks: foreground blocks of shape (width + 2, height + 2), a border of one block around the classified region.
+    water: signed water levels of the same shape.
+    Returns an int16 array of shape (width, height, 4): WORLD_WATER_FLAGS, the displayed level, the width and the height
+    of falling water or corners, the last three in units of WORLD_WATER_PER_BLOCK. Blocks without visible water are 0.
+    """
+    level = numpy.abs(water.astype(numpy.int32))
+    width, height = level.shape[0] - 2, level.shape[1] - 2
+    neighbour = lambda array, x, y: array[1 + x:width + 1 + x, 1 + y:height + 1 + y]
+    center = neighbour(level, 0, 0)
+    top = neighbour(level, 0, 1)
+    bottom = neighbour(level, 0, -1)
+    left = neighbour(level, -1, 0)
+    right = neighbour(level, 1, 0)
+    top_left = neighbour(level, -1, 1)
+    top_right = neighbour(level, 1, 1)
+    air = neighbour(blocks, 0, 0) == 0
+    air_bottom = neighbour(blocks, 0, -1) == 0
+    full = WORLD_WATER_PER_BLOCK
+    low = WORLD_WATER_PER_BLOCK // 10
+    wide = WORLD_WATER_PER_BLOCK // 5
+
+    # Level, filled up by water on both sides or above
+    adjusted = numpy.where(
+        (top > 0) & ((left >= full) | (right >= full)) | (left >= full) & (right >= full),
+        full,
+        numpy.where((top > 0) & (top > center) & air, top, center)
+    )
+    visible = air & (center > 0) & (adjusted > low)
+    maximum = numpy.maximum(adjusted, numpy.maximum(left, right))
+
+    # Water states, checked in order
+    covered = (top > 0) & (top_left > low) & (top_right > low)
+    remaining = visible & ~covered
+    covered &= visible
+    vertical_horizontal = remaining & (~air_bottom | (bottom > full * 9 // 10)) & (top > low)
+    remaining &= ~vertical_horizontal
+    falling = air_bottom & (top > low)
+    vertical = remaining & falling & ((left == 0) | (right == 0))
+    remaining &= ~vertical
+    covered |= remaining & falling & (left > 0) & (right > 0)
+    remaining &= ~covered
+    falling_top = remaining & air_bottom & (top <= low) & (left == 0) & (right == 0)
+    remaining &= ~falling_top
+    corner = remaining & air_bottom & (top == 0) & (bottom < full) & (((left == 0) & (right > 0)) | ((right == 0) & (left > 0)))
+    horizontal = remaining & ~corner | vertical_horizontal
+
+    # Horizontal water without a surface
+    covered |= horizontal & (
+        (maximum >= full)
+        | (top > low) & (top_left > low) & (left >= full)
+        | (top > low) & (top_right > low) & (right >= full)
+    )
+    side = neighbour(water, 0, 0) < 0
+
+    flags = numpy.zeros((width, height, 4), dtype=numpy.int16)
+    flags[:, :, 0] = (
+        covered * WORLD_WATER_FLAGS["full"]
+        + (horizontal & ~covered) * WORLD_WATER_FLAGS["surface"]
+        + ((vertical_horizontal | vertical | falling_top) & ~covered) * WORLD_WATER_FLAGS["falling"]
+        + corner * WORLD_WATER_FLAGS["corner"]
+        + (visible & side) * WORLD_WATER_FLAGS["side"]
+    )
+    flags[:, :, 1] = numpy.where(visible, maximum, 0)
+    flags[:, :, 2] = numpy.where(
+        vertical_horizontal | vertical,
+        numpy.minimum((adjusted + top) // 2, wide),
+        numpy.where(falling_top | corner, numpy.minimum(maximum, wide), 0)
+    )
+    flags[:, :, 3] = numpy.where(
+        vertical_horizontal | vertical,
+        full,
+        numpy.where(falling_top, maximum, numpy.where(corner, numpy.where(side, left, right), 0))
+    )
+    return flags
@@ -1,20 +1,36 @@
 # -*- coding: utf-8 -*-
-from scripts.game.world_generation import generate_world
+from scripts.game.world_generation import generate_world, generate_chunks, generate_chunk_range
+from scripts.game.chunk import Chunk, ChunkManager
+from scripts.game import water
 from scripts.graphics import particle
-from scripts.utility import geometry
 from scripts.utility.const import *
 from scripts.graphics import sound
 from scripts.utility import file
 from scripts.game import player
+from collections import deque
+from itertools import accumulate
+import threading
+import copy
+import pickle
 import time
 
 
 class World:
+    save_excluded: tuple = ("chunks", "entities", "player", "loaded_entities", "entity_water_obstructions", "dirty_chunks", "view", "view_updates", "autosave_thread", "saved_entities", "water_ring_queue", "water_job", "water_ring_jobs", "water_clamped", "water_view", "water_view_updates", "water_flags", "water_flags_dirty", "generation_plan") # Attributes, which are not stored in the header
+
     def __init__(self, block_data, block_generation_properties, block_group_size, block_properties):
-        self.view: numpy.array = None # Sent to shader to render
+        self.view: numpy.array = None # Sent to shader to render; reused between frames
         self.view_size: tuple = (0, 0)
-        self.chunks = {} # {(chunk_x, chunk_y): numpy_array(16x16x4)} -> (block, plant, background, water_level)
+        self.view_start: tuple = (0, 0) # World coordinate of view[0, 0]
+        self.dirty_chunks: dict = {} # {(chunk_x, chunk_y): [start_x, start_y, end_x, end_y]} -> modified blocks since the last view update
+        self.view_updates: list = [] # World rects copied into the view, uploaded by the window
+        self.water_view: numpy.array = None # Water render flags of the view, see water.render_flags
+        self.water_view_updates: list = [] # World rects, in which the water render flags changed
+        self.water_flags: dict = {} # {(chunk_x, chunk_y): water render flags} of the chunks in the view
+        self.water_flags_dirty: set = set() # chunks, whose water render flags may be outdated
+        self.chunks = ChunkManager() # {(chunk_x, chunk_y): Chunk(32x32x4, int16)} -> (block, plant, background, water_level)
         self.camera_stop: int = 0 # maximum camera x
+        self.generation_plan = None # Chunks, which are not generated yet, see world_generation.GenerationPlan
         self.item_count: int = 0
         os.environ["item_count"] = "0"
 
@@ -49,13 +65,73 @@ class World:
         self.block_family["air"] = "air"
         self.block_index[0] = "air"
         self.block_group_size = block_group_size
-        self.blocks_climbable: set = {self.block_name[name] for name in BLOCKS_CLIMBABLE}
+        self.family_names: list = ["air"] + sorted({family for name, family in self.block_family.items() if name != "air"})
+
+        if max(self.block_index) > numpy.iinfo(WORLD_CHUNK_DTYPE).max:
+            raise ValueError("Block indices exceed the range of " + WORLD_CHUNK_DTYPE)
+
+        # Block properties indexed by block id
+        block_count = max(self.block_index) + 1
+        self.lookup_layer: numpy.array = numpy.zeros(block_count, dtype=numpy.uint8)
+        self.lookup_family: numpy.array = numpy.zeros(block_count, dtype=numpy.uint8) # Index in family_names
+        self.lookup_climbable: numpy.array = numpy.zeros(block_count, dtype=bool)
+        self.lookup_friction: numpy.array = numpy.full(block_count, 0.1)
+        self.lookup_solid: numpy.array = numpy.zeros(block_count, dtype=bool) # Foreground blocks
+        self.lookup_light: numpy.array = numpy.zeros(block_count, dtype=bool)
+        self.lookup_ticking: numpy.array = numpy.zeros(block_count, dtype=bool) # Blocks with behaviour, which are updated each tick
+
+        for index, name in self.block_index.items():
+            if not index:
+                continue
+            family = self.block_family[name]
+            self.lookup_layer[index] = self.block_layer[name]
+            self.lookup_family[index] = self.family_names.index(family)
+            self.lookup_solid[index] = self.block_layer[name] == 0
+            self.lookup_light[index] = family == "light"
+        for name in BLOCKS_CLIMBABLE:
+            self.lookup_climbable[self.block_name[name]] = True
+        for name in BLOCKS_TICKING:
+            self.lookup_ticking[self.block_name[name]] = True
+        self.lookup_indexed: numpy.array = self.lookup_ticking | self.lookup_light # Blocks in ticking_blocks
+        for index, properties in self.block_properties.items():
+            self.lookup_friction[index] = properties["friction"]
+
+        # Decoration rules: {(side, corner, water, block name or family): (decoration names, cumulative weights)}
+        selectors = {selector for properties in self.block_generation_properties.values() for selector in properties.get("on", "any").split("|")}
+        targets = [(family, ("any", family)) for family in self.family_names]
+        targets += [(name, ("any", name, family)) for name, family in self.block_family.items() if name in selectors]
+        placements = {(properties.get("side", "above"), properties.get("corner", False)) for properties in self.block_generation_properties.values()}
+        self.decoration_rules: dict = {}
+        for side, corner in placements:
+            for water in (False, True):
+                for target, comparison in targets:
+                    names = [
+                        name for name, properties in self.block_generation_properties.items()
+                        if any(selector in comparison for selector in properties.get("on", "any").split("|"))
+                        and side == properties.get("side", "above")
+                        and properties.get("water", False) in (water, "any")
+                        and corner == properties.get("corner", False)
+                    ]
+                    if names:
+                        weights = list(accumulate(self.block_generation_properties[name].get("weight", 1) for name in names))
+                        self.decoration_rules[(side, corner, water, target)] = (names, weights)
 
         self.entities: set = set()
         self.loaded_entities: set = set()
         self.wind: float = 0.0 # Wind direction
         self.loaded_blocks: tuple = ((0, 0), (0, 0)) # (start, end)
         self.water_update_timer: float = 0.0
+        self.compress_timer: float = 0.0
+        self.water_active: set = set() # chunks, in which water may move; woken by changes to them or their border
+        self.ticking_blocks: dict = {} # {(chunk_x, chunk_y): {(x, y)}} -> blocks with behaviour or light
+        self.water_ring_queue: deque = deque() # active chunks around the view, which are not yet stepped in the current pass
+        self.water_ring_timer: float = 0.0
+        self.water_job: tuple = None # (chunks, snapshot, future) of the water step running on the worker thread
+        self.water_ring_jobs: list = [] # (chunk, snapshot, future) of the water steps around the view running on the worker thread
+        self.water_clamped: int = 0 # Water created by clamping the results of overlapping steps to 0, stays 0 unless steps overlap; reported by the water benchmark
+        self.autosave_timer: float = 0.0
+        self.autosave_thread: threading.Thread = None
+        self.saved_entities: bytes = None # Entities of the last save, which are not written again while unchanged
         self.entity_water_obstructions: set = set()
 
         if PHYSICS_REALISTIC:
@@ -64,23 +140,42 @@ class World:
             self.player: player.Player = player.Player(spawn_pos=[0, 0])
         self.add_entity(self.player)
 
-    def iterate(self):
-        for chunk_x, chunk_y in self.chunks:
-            for delta_x, delta_y in numpy.ndindex((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE)):
-                yield chunk_x * WORLD_CHUNK_SIZE + delta_x, chunk_y * WORLD_CHUNK_SIZE + delta_y
+    def compress_chunks(self, exclude: tuple=None):
+        """
+        Compress all chunks, except those overlapping the block rect exclude ((start_x, start_y), (end_x, end_y)).
+        """
+        if exclude is None:
+            for chunk in self.chunks.resident.values():
+                chunk.compress()
+            return
+
+        (start_x, start_y), (end_x, end_y) = exclude
+        start_chunk_x = start_x >> WORLD_CHUNK_SIZE_POWER
+        start_chunk_y = start_y >> WORLD_CHUNK_SIZE_POWER
+        end_chunk_x = end_x >> WORLD_CHUNK_SIZE_POWER
+        end_chunk_y = end_y >> WORLD_CHUNK_SIZE_POWER
+
+        for (chunk_x, chunk_y), chunk in self.chunks.resident.items():
+            if not chunk.array is None and not (start_chunk_x <= chunk_x <= end_chunk_x and start_chunk_y <= chunk_y <= end_chunk_y):
+                chunk.compress()
 
     def get_block_friction(self, block_type: int):
-        properties = self.block_properties.get(block_type, 0)
-        if properties:
-            return properties["friction"]
-        return 0.1
+        return float(self.lookup_friction[int(block_type)])
+
+    def get_block_family(self, block_type: int):
+        return self.family_names[self.lookup_family[int(block_type)]]
 
     def add_entity(self, entity):
         self.entities.add(entity)
 
     def create_chunk(self, x: int, y: int):
-        self.chunks[(x, y)] = numpy.zeros((32, 32, 4))
-        self.chunks[(x, y)][:, :, 0] = self.block_name["dirt_block"]
+        """
+        Create a missing chunk as dirt. Planned chunks are generated instead, so writes into them are kept.
+        """
+        if not self.generation_plan is None and (x, y) in self.generation_plan.chunks and not (x, y) in self.generation_plan.generated:
+            generate_chunk_range(self, self.generation_plan, x, y, x, y)
+            return
+        self.chunks[(x, y)] = Chunk((self.block_name["dirt_block"], 0, 0, 0))
 
     def get_block_exists(self, x: int, y: int):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
@@ -98,9 +193,62 @@ class World:
 
         if not (chunk_x, chunk_y) in self.chunks:
             self.create_chunk(chunk_x, chunk_y)
-        if isinstance(data, (int, float)) and data:
-            layer = self.block_layer[self.block_index[data]]
-        self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, layer] = data
+        if isinstance(data, (int, float, numpy.integer)) and data:
+            layer = self.lookup_layer[int(data)]
+        chunk = self.chunks[(chunk_x, chunk_y)]
+        replaced = chunk[mod_x, mod_y, layer]
+        placed = data
+        if isinstance(layer, slice):
+            # Selecting the block layers copies the replaced blocks, which would be a view of the chunk otherwise. Water levels are no block ids.
+            block_layers = numpy.arange(4)[layer] < 3
+            replaced = replaced[block_layers]
+            placed = numpy.broadcast_to(data, block_layers.shape)[block_layers]
+        chunk[mod_x, mod_y, layer] = data
+        self.mark_dirty(chunk_x, chunk_y, mod_x, mod_y)
+
+        if numpy.any(self.lookup_indexed[replaced]) or numpy.any(self.lookup_indexed[placed]):
+            self.index_blocks((chunk_x, chunk_y), slice(mod_x, mod_x + 1), slice(mod_y, mod_y + 1))
+
+    def index_blocks(self, coord: tuple, chunk_slice_x: slice=slice(None), chunk_slice_y: slice=slice(None)):
+        """
+        Update the ticking blocks of a rect within a chunk.
+        """
+        indexed = self.lookup_indexed[self.chunks[coord][chunk_slice_x, chunk_slice_y, :3]].any(axis=2)
+        offset_x = coord[0] * WORLD_CHUNK_SIZE + (chunk_slice_x.start or 0)
+        offset_y = coord[1] * WORLD_CHUNK_SIZE + (chunk_slice_y.start or 0)
+
+        blocks = self.ticking_blocks.get(coord, set())
+        blocks.difference_update([
+            (x, y) for x, y in blocks
+            if 0 <= x - offset_x < indexed.shape[0] and 0 <= y - offset_y < indexed.shape[1]
+        ])
+        blocks.update((offset_x + int(x), offset_y + int(y)) for x, y in numpy.argwhere(indexed))
+
+        if blocks:
+            self.ticking_blocks[coord] = blocks
+        else:
+            self.ticking_blocks.pop(coord, None)
+
+    def get_ticking_blocks(self, start_x: int, start_y: int, end_x: int, end_y: int):
+        """
+        Returns the coords of ticking and light emitting blocks in [start_x, end_x) x [start_y, end_y).
+        """
+        return [
+            (x, y)
+            for chunk_x in range(start_x >> WORLD_CHUNK_SIZE_POWER, ((end_x - 1) >> WORLD_CHUNK_SIZE_POWER) + 1)
+            for chunk_y in range(start_y >> WORLD_CHUNK_SIZE_POWER, ((end_y - 1) >> WORLD_CHUNK_SIZE_POWER) + 1)
+            for x, y in self.ticking_blocks.get((chunk_x, chunk_y), ())
+            if start_x <= x < end_x and start_y <= y < end_y
+        ]
+
+    def get_light_sources(self, start_x: int, start_y: int, end_x: int, end_y: int):
+        """
+        Returns the coords of light emitting blocks in [start_x, end_x) x [start_y, end_y).
+        """
+        return [
+            (x, y) for x, y in self.get_ticking_blocks(start_x, start_y, end_x, end_y)
+            if self.lookup_light[self.get_block(x, y, layer=slice(0, 3))].any()
+        ]
     
     def get_block(self, x: int, y: int, layer: int=0, generate: bool=False, default: int=(0, 0, 0, 0)):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
@@ -126,6 +274,42 @@ class World:
         if not (chunk_x, chunk_y) in self.chunks:
             self.create_chunk(chunk_x, chunk_y)
         self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3] = int(level)
+        self.mark_dirty(chunk_x, chunk_y, mod_x, mod_y)
+
+    def mark_dirty(self, chunk_x: int, chunk_y: int, mod_x: int, mod_y: int, width: int=1, height: int=1):
+        """
+        Extend the dirty rect of a chunk, which is copied into the view and uploaded on the next frame.
+        Wakes the water simulation of the chunk and of the neighbours bordering the rect.
+        """
+        self.chunks.mark_modified((chunk_x, chunk_y))
+        self.water_active.add((chunk_x, chunk_y))
+        if mod_x == 0:
+            self.water_active.add((chunk_x - 1, chunk_y))
+        if mod_x + width == WORLD_CHUNK_SIZE:
+            self.water_active.add((chunk_x + 1, chunk_y))
+        if mod_y == 0:
+            self.water_active.add((chunk_x, chunk_y - 1))
+        if mod_y + height == WORLD_CHUNK_SIZE:
+            self.water_active.add((chunk_x, chunk_y + 1))
+
+        # Water render flags depend on the surrounding blocks
+        for neighbour_x in range(chunk_x - (mod_x == 0), chunk_x + (mod_x + width == WORLD_CHUNK_SIZE) + 1):
+            for neighbour_y in range(chunk_y - (mod_y == 0), chunk_y + (mod_y + height == WORLD_CHUNK_SIZE) + 1):
+                self.water_flags_dirty.add((neighbour_x, neighbour_y))
+
+        rect = self.dirty_chunks.get((chunk_x, chunk_y))
+        if rect is None:
+            self.dirty_chunks[(chunk_x, chunk_y)] = [mod_x, mod_y, mod_x + width, mod_y + height]
+            return
+
+        if mod_x < rect[0]:
+            rect[0] = mod_x
+        if mod_y < rect[1]:
+            rect[1] = mod_y
+        if mod_x + width > rect[2]:
+            rect[2] = mod_x + width
+        if mod_y + height > rect[3]:
+            rect[3] = mod_y + height
 
     def get_water(self, x, y):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
@@ -136,7 +320,7 @@ class World:
 
         mod_x = x & (WORLD_CHUNK_SIZE - 1)
         mod_y = y & (WORLD_CHUNK_SIZE - 1)
-        return abs(self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3])
+        return abs(int(self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3]))
 
     def get_water_side(self, x, y):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
@@ -150,8 +334,129 @@ class World:
 
         return copysign(1, abs(self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3]))
 
+    def chunk_slices(self, start_x: int, start_y: int, end_x: int, end_y: int):
+        """
+        Split the block rect [start_x, end_x) x [start_y, end_y) at chunk borders.
+        Yields (chunk_x, chunk_y), slices within the chunk and slices within the rect.
+        """
+        for chunk_x in range(start_x >> WORLD_CHUNK_SIZE_POWER, ((end_x - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+            part_start_x = max(start_x, chunk_x * WORLD_CHUNK_SIZE)
+            part_end_x = min(end_x, (chunk_x + 1) * WORLD_CHUNK_SIZE)
+            chunk_slice_x = slice(part_start_x - chunk_x * WORLD_CHUNK_SIZE, part_end_x - chunk_x * WORLD_CHUNK_SIZE)
+            region_slice_x = slice(part_start_x - start_x, part_end_x - start_x)
+
+            for chunk_y in range(start_y >> WORLD_CHUNK_SIZE_POWER, ((end_y - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+                part_start_y = max(start_y, chunk_y * WORLD_CHUNK_SIZE)
+                part_end_y = min(end_y, (chunk_y + 1) * WORLD_CHUNK_SIZE)
+                chunk_slice_y = slice(part_start_y - chunk_y * WORLD_CHUNK_SIZE, part_end_y - chunk_y * WORLD_CHUNK_SIZE)
+                region_slice_y = slice(part_start_y - start_y, part_end_y - start_y)
+
+                yield (chunk_x, chunk_y), chunk_slice_x, chunk_slice_y, region_slice_x, region_slice_y
+
+    def generate_planned(self, start_x: int, start_y: int, end_x: int, end_y: int):
+        """
+        Generate the blocks of the planned chunks overlapping [start_x, end_x) x [start_y, end_y), which would be read as air otherwise.
+        """
+        if not self.generation_plan is None:
+            generate_chunk_range(
+                self, self.generation_plan,
+                start_x >> WORLD_CHUNK_SIZE_POWER, start_y >> WORLD_CHUNK_SIZE_POWER,
+                (end_x - 1) >> WORLD_CHUNK_SIZE_POWER, (end_y - 1) >> WORLD_CHUNK_SIZE_POWER
+            )
+
+    def get_region(self, start_x: int, start_y: int, end_x: int, end_y: int, layer=slice(None), generate: bool=False, default=(0, 0, 0, 0)):
+        """
+        Returns the blocks in [start_x, end_x) x [start_y, end_y) as an array of shape (width, height) or (width, height, layers).
+        Missing chunks are filled with default, or created if generate is set.
+        """
+        layers_shape = numpy.empty(4)[layer].shape
+        region = numpy.empty((end_x - start_x, end_y - start_y, *layers_shape), dtype=WORLD_CHUNK_DTYPE)
+        if not region.size:
+            return region
+
+        if isinstance(default, (tuple, list)):
+            default = numpy.asarray(default)[layer]
+
+        for coord, chunk_slice_x, chunk_slice_y, region_slice_x, region_slice_y in self.chunk_slices(start_x, start_y, end_x, end_y):
+            if not coord in self.chunks:
+                if not generate:
+                    region[region_slice_x, region_slice_y] = default
+                    continue
+                self.create_chunk(*coord)
+            region[region_slice_x, region_slice_y] = self.chunks[coord][chunk_slice_x, chunk_slice_y, layer]
+
+        return region
+
+    def set_region(self, start_x: int, start_y: int, data: numpy.array, layer=None, mask: numpy.array=None):
+        """
+        Write an array of blocks with its lower left corner at (start_x, start_y). Missing chunks are created.
+        layer: layer index or slice matching the last axis of data. If None, the layer of each block is looked up (air is written into layer 0).
+        mask: boolean array of shape (width, height); only blocks where mask is set are written.
+        """
+        end_x = start_x + data.shape[0]
+        end_y = start_y + data.shape[1]
+        if start_x >= end_x or start_y >= end_y:
+            return
+
+        if layer is None:
+            block_layers = self.lookup_layer[data]
+            layers = [(block_layer, block_layers == block_layer) for block_layer in numpy.unique(block_layers)]
+            indexed_layers = True
+        else:
+            layers = [(layer, None)]
+            indexed_layers = numpy.any(numpy.arange(4)[layer] < 3)
+
+        for coord, chunk_slice_x, chunk_slice_y, region_slice_x, region_slice_y in self.chunk_slices(start_x, start_y, end_x, end_y):
+            region_mask = None if mask is None else mask[region_slice_x, region_slice_y]
+            if not region_mask is None and not region_mask.any():
+                continue
+
+            if not coord in self.chunks:
+                self.create_chunk(*coord)
+            chunk = self.chunks[coord]
+            region_data = data[region_slice_x, region_slice_y]
+
+            for block_layer, layer_mask in layers:
+                if not layer_mask is None:
+                    layer_mask = layer_mask[region_slice_x, region_slice_y]
+                    if not region_mask is None:
+                        layer_mask = layer_mask & region_mask
+                else:
+                    layer_mask = region_mask
+
+                if layer_mask is None:
+                    chunk[chunk_slice_x, chunk_slice_y, block_layer] = region_data
+                    continue
+                if not layer_mask.any():
+                    continue
+
+                if region_data.ndim == 3:
+                    layer_mask = layer_mask[:, :, None]
+                chunk[chunk_slice_x, chunk_slice_y, block_layer] = numpy.where(layer_mask, region_data, chunk[chunk_slice_x, chunk_slice_y, block_layer])
+
+            if indexed_layers:
+                self.index_blocks(coord, chunk_slice_x, chunk_slice_y)
+
+            if region_mask is None:
+                self.mark_dirty(
+                    coord[0], coord[1], chunk_slice_x.start, chunk_slice_y.start,
+                    chunk_slice_x.stop - chunk_slice_x.start, chunk_slice_y.stop - chunk_slice_y.start
+                )
+            else:
+                # Only mark the bounding box of the written blocks
+                columns = numpy.flatnonzero(region_mask.any(axis=1))
+                rows = numpy.flatnonzero(region_mask.any(axis=0))
+                self.mark_dirty(
+                    coord[0], coord[1], chunk_slice_x.start + columns[0], chunk_slice_y.start + rows[0],
+                    columns[-1] - columns[0] + 1, rows[-1] - rows[0] + 1
+                )
+
     def update_physics(self, window):
         for entity in self.loaded_entities.copy():
+            # Entities can move before the chunks around them are generated for the view (e.g. in the first frame)
+            x = floor(entity.rect.x)
+            y = floor(entity.rect.y)
+            self.generate_planned(x - WORLD_CHUNK_SIZE, y - WORLD_CHUNK_SIZE, x + WORLD_CHUNK_SIZE, y + WORLD_CHUNK_SIZE)
             if entity.health <= 0 and not entity is self.player:
                 self.player.obtain_weapon_drop(window, entity)
                 self.entities.discard(entity)
@@ -190,10 +495,21 @@ class World:
         elif self.player.rect.x > 20 and not random.randint(0, int(60 / delta_time)):
             sound.play(window, "cave_ambient", x=random.random() * 2 - 1)
 
-        # Update water
-        for y in geometry.shuffled_range(self.view_size[1] - 1):
-            for x in geometry.shuffled_range(self.view_size[0] - 1):
-                self.update_block(window, self.loaded_blocks[0][0] + x, self.loaded_blocks[0][1] + y)
+        # Update water and torches
+        self.update_blocks(window)
+        self.update_water_ring(window, delta_time)
+
+        # Compress chunks, which left the view
+        self.compress_timer += delta_time
+        if self.compress_timer > WORLD_CHUNK_COMPRESS_INTERVAL:
+            self.compress_timer = 0.0
+            self.compress_chunks(exclude=self.loaded_blocks)
+
+        # Save changed chunks in the background
+        self.autosave_timer += delta_time
+        if self.autosave_timer > WORLD_AUTOSAVE_INTERVAL and window.options["save world"]:
+            self.autosave_timer = 0.0
+            self.autosave()
 
         # Update particles
         if window.options["particles"]:
@@ -208,146 +524,306 @@ class World:
 
     def draw(self, window):
         self.loaded_blocks = window.camera.visible_blocks()
+        generate_chunks(self, window)
         self.create_view(window)
 
         for entity in self.loaded_entities:
             entity.draw(window)
 
-    def update_block(self, window, x, y):
-        block_array = self.get_block(x, y, layer=slice(None), generate=True)
-
-        # Update water
-        self.update_block_water(window, x, y)
+    def update_blocks(self, window):
+        """
+        Run a water step on the active chunks in the view and update the ticking blocks in it.
+        Chunks, in which no water moved, sleep until a change to them or their border wakes them again.
+        The step runs on the water worker thread and is published in the next update.
+        """
+        # Publish the water step started in the last update and start the next one on the worker thread
+        if not self.water_job is None:
+            chunks, snapshot, result = self.water_job
+            self.water_job = None
+            self.apply_water(snapshot, result.result())
 
-        # Update torches
-        if self.block_index[block_array[1]] in ("torch", "torch_flipped"):
+        (start_x, start_y), (end_x, end_y) = self.loaded_blocks
+        active = [
+            (chunk_x, chunk_y)
+            for chunk_x in range(start_x >> WORLD_CHUNK_SIZE_POWER, ((end_x - 1) >> WORLD_CHUNK_SIZE_POWER) + 1)
+            for chunk_y in range(start_y >> WORLD_CHUNK_SIZE_POWER, ((end_y - 1) >> WORLD_CHUNK_SIZE_POWER) + 1)
+            if (chunk_x, chunk_y) in self.water_active
+            and not any(chunk == (chunk_x, chunk_y) for chunk, snapshot, result in self.water_ring_jobs)
+        ]
+        if active:
+            snapshot = self.snapshot_water(active)
+            self.water_job = (active, snapshot, water.executor.submit(water.step_compiled, *snapshot[1:]))
+
+        # Update ticking blocks
+        for x, y in self.get_ticking_blocks(start_x, start_y, end_x, end_y):
+            self.update_ticking_block(window, x, y)
+
+    def update_ticking_block(self, window, x: int, y: int):
+        plant = self.get_block(x, y, layer=1)
+        if plant == self.block_name["torch"] or plant == self.block_name["torch_flipped"]:
             particle.spawn(window, "fire_particle", x + 0.5, y + 0.7)
-            if block_array[3] > 600:
+            if self.get_water(x, y) > 600:
                 self.set_block(x, y, self.block_name["unlit_torch"])
 
-    def update_block_water(self, window, x, y):
-        water_level = self.get_water(x, y)
-        if not water_level:
-            return
-
-        emmitable_water = min(water_level / 2, WORLD_WATER_PER_BLOCK / 2)
-        overflow_water = max(0, water_level - WORLD_WATER_PER_BLOCK) / 4
-        water_side = self.get_water_side(x, y)
-
-        if self.get_water(x, y + 1):
-            water_side = self.get_water_side(x, y + 1)
-
-        # Block below
-        if not self.get_block(x, y - 1):
-            water_level_below = self.get_water(x, y - 1)
-            absorbable_water = max(0, WORLD_WATER_PER_BLOCK - water_level_below + overflow_water)
-
-            absorbed_water = min(absorbable_water, emmitable_water)
-            water_level -= absorbed_water
-            emmitable_water -= absorbed_water
-            water_level_below += absorbed_water
-
-            self.set_water(x, y - 1, water_level_below * water_side)
-
-        if not emmitable_water:
-            self.set_water(x, y, water_level * water_side)
-            return
-
-        # Blocks on both sides
-        blocks = {(x, y): water_level}
-        total_water = water_level
-
-        for _x, _y in ((x - 1, y), (x + 1, y)):
-            if not (self.get_block(_x, _y) or self.get_block(_x, _y - 1) and self.get_water(_x, _y - 1) > 1):
-                water_level_target = self.get_water(_x, _y)
-                total_water += water_level_target
-                blocks[(_x, _y)] = water_level_target
-
-        max_water = len(blocks) * WORLD_WATER_PER_BLOCK
-        if total_water > max_water:
-            emmitable_water = total_water - max_water
-            total_water = max_water
-        else:
-            emmitable_water = 0
-
-        for (_x, _y), old_water_level_target in blocks.items():
-            water_level_target = total_water / len(blocks)
-            water_side = self.get_water_side(_x, _y)
-            
-            if water_level_target > old_water_level_target:
-                if _x < x:
-                    water_side = 1
-                elif _x > x:
-                    water_side = -1
+    def update_water_ring(self, window, delta_time: float):
+        """
+        Step the active chunks in a ring around the view every WORLD_WATER_RING_INTERVAL seconds.
+        The ring grows with the simulation distance. Its chunks are stepped round-robin, as many per update as fit into WORLD_WATER_RING_BUDGET.
+        The steps run on the water worker thread behind the step of the view and are published in a later update once they are done.
+        New chunks are only stepped when all of them are published. Chunks in the pending step of the view are skipped, as both steps would move the same water.
+        """
+        self.water_ring_timer += delta_time
+
+        # Publish the finished steps without waiting for the worker thread
+        if self.water_ring_jobs:
+            running = []
+            for chunk, snapshot, result in self.water_ring_jobs:
+                if result.done():
+                    self.apply_water(snapshot, result.result())
                 else:
-                    if blocks.get((x + 1, y), 1) < blocks.get((x - 1, y), 0):
-                        water_side = 1
-                    else:
-                        water_side = -1
-
-            if self.get_water(_x, _y + 1):
-                water_side = self.get_water_side(_x, _y)
-
-            self.set_water(_x, _y, water_level_target * water_side)
+                    running.append((chunk, snapshot, result))
+            self.water_ring_jobs = running
+            if running:
+                return
+
+        if not self.water_ring_queue:
+            if self.water_ring_timer < WORLD_WATER_RING_INTERVAL:
+                return
+            self.water_ring_timer = 0.0
+
+            (start_x, start_y), (end_x, end_y) = self.loaded_blocks
+            start_chunk_x = start_x >> WORLD_CHUNK_SIZE_POWER
+            start_chunk_y = start_y >> WORLD_CHUNK_SIZE_POWER
+            end_chunk_x = (end_x - 1) >> WORLD_CHUNK_SIZE_POWER
+            end_chunk_y = (end_y - 1) >> WORLD_CHUNK_SIZE_POWER
+            distance = max(1, ceil(window.options["simulation distance"] * WORLD_WATER_RING_SCALE))
+
+            self.water_ring_queue.extend(
+                (chunk_x, chunk_y)
+                for chunk_x in range(start_chunk_x - distance, end_chunk_x + distance + 1)
+                for chunk_y in range(start_chunk_y - distance, end_chunk_y + distance + 1)
+                if (chunk_x, chunk_y) in self.water_active
+                and not (start_chunk_x <= chunk_x <= end_chunk_x and start_chunk_y <= chunk_y <= end_chunk_y)
+            )
+
+        pending = () if self.water_job is None else self.water_job[0]
+        end_time = time.perf_counter() + WORLD_WATER_RING_BUDGET
+        while self.water_ring_queue and time.perf_counter() < end_time:
+            chunk = self.water_ring_queue.popleft()
+            if chunk in self.water_active and not chunk in pending:
+                snapshot = self.snapshot_water([chunk])
+                self.water_ring_jobs.append((chunk, snapshot, water.executor.submit(water.step_compiled, *snapshot[1:])))
+
+    def wait_water(self):
+        """
+        Wait for the pending water steps of the view and the ring and publish them.
+        """
+        if not self.water_job is None:
+            chunks, snapshot, result = self.water_job
+            self.water_job = None
+            self.apply_water(snapshot, result.result())
+        for chunk, snapshot, result in self.water_ring_jobs:
+            self.apply_water(snapshot, result.result())
+        self.water_ring_jobs = []
+
+    def snapshot_water(self, chunks: list):
+        """
+        Read the bounding box of the chunks with a border of one block, which receives water, but is not simulated.
+        Planned chunks in it are generated first. The chunks are put to sleep, writing changed water wakes them again.
+        Returns ((start_x, start_y), water levels, solid mask, simulated mask).
+        """
+        start_x = min(chunk_x for chunk_x, chunk_y in chunks) * WORLD_CHUNK_SIZE - 1
+        start_y = min(chunk_y for chunk_x, chunk_y in chunks) * WORLD_CHUNK_SIZE - 1
+        end_x = (max(chunk_x for chunk_x, chunk_y in chunks) + 1) * WORLD_CHUNK_SIZE + 1
+        end_y = (max(chunk_y for chunk_x, chunk_y in chunks) + 1) * WORLD_CHUNK_SIZE + 1
+        self.generate_planned(start_x, start_y, end_x, end_y)
+        blocks = self.get_region(start_x, start_y, end_x, end_y)
+
+        simulated = numpy.zeros(blocks.shape[:2], dtype=bool)
+        for chunk_x, chunk_y in chunks:
+            region_x = chunk_x * WORLD_CHUNK_SIZE - start_x
+            region_y = chunk_y * WORLD_CHUNK_SIZE - start_y
+            simulated[region_x:region_x + WORLD_CHUNK_SIZE, region_y:region_y + WORLD_CHUNK_SIZE] = True
+        self.water_active.difference_update(chunks)
+
+        return (start_x, start_y), numpy.abs(blocks[:, :, 3].astype(numpy.int32)), blocks[:, :, 0] != 0, simulated
+
+    def apply_water(self, snapshot: tuple, result: tuple):
+        """
+        Write the result of a water step on a snapshot. The moved water is added to the current levels,
+        so edits made while the step was running are kept and simulated in the next step.
+        Levels below 0 can only come from steps overlapping on the same blocks; the water created by clamping them is counted in water_clamped.
+        """
+        (start_x, start_y), water_level = snapshot[:2]
+        new_water_level, water_side = result
+        changed = new_water_level != water_level
+        if not changed.any():
+            return
 
-        # Block above
-        water_side = self.get_water_side(x, y + 1)
-        water_level_target_above = self.get_water(x, y + 1)
-        self.set_water(x, y + 1, (water_level_target_above + emmitable_water) * water_side)
+        current_water_level = numpy.abs(self.get_region(start_x, start_y, start_x + changed.shape[0], start_y + changed.shape[1], layer=3).astype(numpy.int32))
+        water_level = current_water_level + new_water_level - water_level
+        self.water_clamped -= int(water_level[water_level < 0].sum())
+        water_level = numpy.maximum(0, water_level)
+        self.set_region(start_x, start_y, (water_level * water_side).astype(WORLD_CHUNK_DTYPE), layer=3, mask=changed)
 
     def create_view(self, window):
+        """
+        Update the persistent view buffer. Only dirty chunks and the rows/columns exposed by scrolling are copied.
+        """
         start, end = self.loaded_blocks
         self.view_size = (end[0] - start[0], end[1] - start[1])
+        self.chunks.set_focus(
+            (start[0] >> WORLD_CHUNK_SIZE_POWER, start[1] >> WORLD_CHUNK_SIZE_POWER),
+            ((end[0] - 1) >> WORLD_CHUNK_SIZE_POWER, (end[1] - 1) >> WORLD_CHUNK_SIZE_POWER)
+        )
+
+        if self.view is None or self.view.shape[:2] != self.view_size:
+            # Resized: copy everything
+            self.view = numpy.empty((*self.view_size, 4), dtype=WORLD_CHUNK_DTYPE)
+            self.water_view = numpy.empty((*self.view_size, 4), dtype=WORLD_CHUNK_DTYPE)
+            self.view_start = start
+            self.dirty_chunks.clear()
+            self.water_flags.clear()
+            self.water_flags_dirty.clear()
+            self.copy_to_view(*start, *end)
+            self.send_view(window)
+            return
 
-        start_chunk_x = start[0] >> WORLD_CHUNK_SIZE_POWER
-        start_chunk_y = start[1] >> WORLD_CHUNK_SIZE_POWER
-        start_mod_x = start[0] & (WORLD_CHUNK_SIZE - 1)
-        start_mod_y = start[1] & (WORLD_CHUNK_SIZE - 1)
-        chunk_num_x = ceil((start_mod_x + self.view_size[0]) / WORLD_CHUNK_SIZE)
-        chunk_num_y = ceil((start_mod_y + self.view_size[1]) / WORLD_CHUNK_SIZE)
-        uncut_view = numpy.empty((chunk_num_x * WORLD_CHUNK_SIZE, chunk_num_y * WORLD_CHUNK_SIZE, 4))
-
-        #print("view_size", self.view_size)
-        #print("start", start)
-        #print("end", end)
-        #print("start_chunk", start_chunk_x, start_chunk_y)
-        #print("start_mod", start_mod_x, start_mod_y)
-        #print("chunk_num", chunk_num_x, chunk_num_y)
-
-        for chunk_delta_x, chunk_delta_y in numpy.ndindex((chunk_num_x, chunk_num_y)):
-            chunk_x = start_chunk_x + chunk_delta_x
-            chunk_y = start_chunk_y + chunk_delta_y
-
-            if not (chunk_x, chunk_y) in self.chunks:
-                self.chunks[(chunk_x, chunk_y)] = numpy.zeros((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE, 4))
-                self.chunks[(chunk_x, chunk_y)][:, :, 0] = self.block_name["dirt_block"]
-
-            uncut_view[chunk_delta_x * WORLD_CHUNK_SIZE:(chunk_delta_x + 1) * WORLD_CHUNK_SIZE, chunk_delta_y * WORLD_CHUNK_SIZE:(chunk_delta_y + 1) * WORLD_CHUNK_SIZE] = self.chunks[(chunk_x, chunk_y)]
-
-        window.world_view = self.view = uncut_view[start_mod_x:start_mod_x + self.view_size[0], start_mod_y:start_mod_y + self.view_size[1]]
-
-            # print("chunk", "[rel]", chunk_delta_x, chunk_delta_y, "[abs]", chunk_x, chunk_y)
-            
-            # copy_start_x = max(start[0], chunk_x * WORLD_CHUNK_SIZE) & (WORLD_CHUNK_SIZE - 1)
-            # copy_start_y = max(start[1], chunk_y * WORLD_CHUNK_SIZE) & (WORLD_CHUNK_SIZE - 1)
-            # copy_end_x = min(end[0], (chunk_x + 1) * WORLD_CHUNK_SIZE - 1) & (WORLD_CHUNK_SIZE - 1)
-            # copy_end_y = min(end[1], (chunk_y + 1) * WORLD_CHUNK_SIZE - 1) & (WORLD_CHUNK_SIZE - 1)
-            # print("copy start", copy_start_x, copy_start_y)
-            # print("copy end", copy_end_x, copy_end_y)
-            # print("copy size", copy_end_x - copy_start_x, copy_end_y - copy_start_y)
-
-            # dest_start_x = max(0, WORLD_CHUNK_SIZE * (chunk_x) - start_mod_x)
-            # dest_start_y = max(0, WORLD_CHUNK_SIZE * (chunk_y) - start_mod_y)
-            # dest_end_x = copy_end_x - copy_start_x + dest_start_x#min(self.view_size[0], start_mod_x + WORLD_CHUNK_SIZE * (chunk_x - 1))
-            # dest_end_y = copy_end_y - copy_start_y + dest_start_y#min(self.view_size[1], start_mod_y + WORLD_CHUNK_SIZE * (chunk_y - 1))
-            # print("dest start", dest_start_x, dest_start_y)
-            # print("dest end", dest_end_x, dest_end_y)
-            # print("dest size", dest_end_x - dest_start_x, dest_end_y - dest_start_y)
-
-            # data = self.chunks[(chunk_x, chunk_y)][copy_start_x:copy_end_x, copy_start_y:copy_end_y]
-            # self.view[dest_start_x:dest_end_x, dest_start_y:dest_end_y] = data
+        shift_x = start[0] - self.view_start[0]
+        shift_y = start[1] - self.view_start[1]
+        self.view_start = start
+
+        if abs(shift_x) >= self.view_size[0] or abs(shift_y) >= self.view_size[1]:
+            # Jumped: nothing can be reused
+            self.water_flags.clear()
+            self.water_flags_dirty.clear()
+            self.copy_to_view(*start, *end)
+        elif shift_x or shift_y:
+            # Scrolled: shift buffer in place and fill exposed rows and columns
+            width, height = self.view_size
+            for view in (self.view, self.water_view):
+                view[max(0, -shift_x):width - max(0, shift_x), max(0, -shift_y):height - max(0, shift_y)] = \
+                    view[max(0, shift_x):width - max(0, -shift_x), max(0, shift_y):height - max(0, -shift_y)]
+            self.update_water_view(start, end)
+
+            if shift_x > 0:
+                self.copy_to_view(end[0] - shift_x, start[1], end[0], end[1])
+            elif shift_x < 0:
+                self.copy_to_view(start[0], start[1], start[0] - shift_x, end[1])
+            if shift_y > 0:
+                self.copy_to_view(start[0], end[1] - shift_y, end[0], end[1])
+            elif shift_y < 0:
+                self.copy_to_view(start[0], start[1], end[0], start[1] - shift_y)
+        else:
+            self.update_water_view(start, end)
+
+        # Copy modified blocks
+        for (chunk_x, chunk_y), (dirty_start_x, dirty_start_y, dirty_end_x, dirty_end_y) in self.dirty_chunks.items():
+            self.copy_to_view(
+                max(start[0], chunk_x * WORLD_CHUNK_SIZE + dirty_start_x),
+                max(start[1], chunk_y * WORLD_CHUNK_SIZE + dirty_start_y),
+                min(end[0], chunk_x * WORLD_CHUNK_SIZE + dirty_end_x),
+                min(end[1], chunk_y * WORLD_CHUNK_SIZE + dirty_end_y),
+                water_flags=False
+            )
+        self.dirty_chunks.clear()
+
+        self.send_view(window)
+
+    def send_view(self, window):
+        """
+        Pass the view and the rects changed since the last frame to the window.
+        """
+        window.world_view = self.view
+        window.world_view_start = self.view_start
+        window.world_view_updates.extend(self.view_updates)
+        self.view_updates.clear()
+        window.world_water_view = self.water_view
+        window.world_water_view_updates.extend(self.water_view_updates)
+        self.water_view_updates.clear()
+
+    def copy_to_view(self, start_x: int, start_y: int, end_x: int, end_y: int, water_flags: bool=True):
+        """
+        Copy the blocks in [start_x, end_x) x [start_y, end_y) from the chunks into the view buffer.
+        The water render flags are copied as well, unless water_flags is False; changed flags are copied by update_water_view.
+        """
+        if start_x >= end_x or start_y >= end_y:
+            return
+        self.view_updates.append((start_x, start_y, end_x, end_y))
+        if water_flags:
+            self.water_view_updates.append((start_x, start_y, end_x, end_y))
+
+        view_start_x = start_x - self.view_start[0]
+        view_start_y = start_y - self.view_start[1]
+        for coord, chunk_slice_x, chunk_slice_y, region_slice_x, region_slice_y in self.chunk_slices(start_x, start_y, end_x, end_y):
+            if not coord in self.chunks:
+                self.create_chunk(*coord)
+
+            self.view[
+                region_slice_x.start + view_start_x:region_slice_x.stop + view_start_x,
+                region_slice_y.start + view_start_y:region_slice_y.stop + view_start_y
+            ] = self.chunks[coord][chunk_slice_x, chunk_slice_y]
+            if water_flags:
+                self.water_view[
+                    region_slice_x.start + view_start_x:region_slice_x.stop + view_start_x,
+                    region_slice_y.start + view_start_y:region_slice_y.stop + view_start_y
+                ] = self.get_water_flags(coord)[0][chunk_slice_x, chunk_slice_y]
+
+    def update_water_view(self, start: tuple, end: tuple):
+        """
+        Recompute the water render flags of changed chunks in the view [start, end) and copy them into the view, if they differ.
+        Flags of chunks, which left the view, are dropped.
+        """
+        chunk_start = (start[0] >> WORLD_CHUNK_SIZE_POWER, start[1] >> WORLD_CHUNK_SIZE_POWER)
+        chunk_end = ((end[0] - 1) >> WORLD_CHUNK_SIZE_POWER, (end[1] - 1) >> WORLD_CHUNK_SIZE_POWER)
+        in_view = lambda chunk_x, chunk_y: chunk_start[0] <= chunk_x <= chunk_end[0] and chunk_start[1] <= chunk_y <= chunk_end[1]
+        for coord in [coord for coord in self.water_flags if not in_view(*coord)]:
+            del self.water_flags[coord]
+
+        for coord in self.water_flags_dirty:
+            if not coord in self.water_flags:
+                continue
+            flags, changed = self.get_water_flags(coord)
+            if not changed:
+                continue
+
+            rect_start_x = max(start[0], coord[0] * WORLD_CHUNK_SIZE)
+            rect_start_y = max(start[1], coord[1] * WORLD_CHUNK_SIZE)
+            rect_end_x = min(end[0], (coord[0] + 1) * WORLD_CHUNK_SIZE)
+            rect_end_y = min(end[1], (coord[1] + 1) * WORLD_CHUNK_SIZE)
+            self.water_view_updates.append((rect_start_x, rect_start_y, rect_end_x, rect_end_y))
+            self.water_view[
+                rect_start_x - self.view_start[0]:rect_end_x - self.view_start[0],
+                rect_start_y - self.view_start[1]:rect_end_y - self.view_start[1]
+            ] = flags[
+                rect_start_x - coord[0] * WORLD_CHUNK_SIZE:rect_end_x - coord[0] * WORLD_CHUNK_SIZE,
+                rect_start_y - coord[1] * WORLD_CHUNK_SIZE:rect_end_y - coord[1] * WORLD_CHUNK_SIZE
+            ]
+        self.water_flags_dirty.clear()
+
+    def get_water_flags(self, coord: tuple):
+        """
+        Returns the water render flags of a chunk and whether they changed. Flags are cached until the chunk or its border is modified.
+        """
+        flags = self.water_flags.get(coord)
+        if not flags is None and not coord in self.water_flags_dirty:
+            return flags, False
+
+        start_x = coord[0] * WORLD_CHUNK_SIZE - 1
+        start_y = coord[1] * WORLD_CHUNK_SIZE - 1
+        region = self.get_region(
+            start_x, start_y, start_x + WORLD_CHUNK_SIZE + 2, start_y + WORLD_CHUNK_SIZE + 2,
+            layer=slice(0, 4, 3), default=(self.block_name["dirt_block"], 0, 0, 0) # Missing chunks are created as dirt
+        )
+        new_flags = water.render_flags(region[:, :, 0], region[:, :, 1])
+        self.water_flags[coord] = new_flags
+        return new_flags, flags is None or not numpy.array_equal(flags, new_flags)
 
     def save(self, window):
+        """
+        Write the world into the save: a header with the world attributes and the chunk index, the entities, the chunk file and the generation plan.
+        Only chunks changed since the last save, including autosaves, are appended to the chunk file.
+        """
         window.loading_progress[:3] = "Saving inventory", 0, 2
         if not window.options["save world"]:
             return        
@@ -355,27 +831,167 @@ class World:
         self.item_count = int(os.environ.get("item_count"))
         self.player.inventory.save(self)
         window.loading_progress[:2] = "Saving world", 1
-        file.save("data/user/world.data", self, file_format="pickle")
+
+        self.wait_autosave()
+        self.write_save(*self.collect_save())
+
         window.loading_progress[1] = 2
         time.sleep(0.1)
 
+    def autosave(self):
+        """
+        Write the changes since the last save in the background. Skipped while the previous autosave is running.
+        """
+        if not self.autosave_thread is None and self.autosave_thread.is_alive():
+            return
+        self.item_count = int(os.environ.get("item_count"))
+        self.autosave_thread = threading.Thread(target=self.write_save, args=self.collect_save(), daemon=True)
+        self.autosave_thread.start()
+
+    def wait_autosave(self):
+        if not self.autosave_thread is None:
+            self.autosave_thread.join()
+            self.autosave_thread = None
+
+    def collect_save(self):
+        """
+        Snapshot the changed chunks, the entities and the world attributes in the main thread.
+        The entities are written as a whole, but only if they changed since the last save.
+        The attributes are copied, as the main thread keeps changing them (e.g. ticking_blocks) while they are written.
+        """
+        attributes = copy.deepcopy({key: value for key, value in self.__dict__.items() if not key in World.save_excluded})
+        if not self.water_job is None:
+            attributes["water_active"] |= set(self.water_job[0]) # Chunks of the pending water steps are only asleep until they are published
+        attributes["water_active"] |= {chunk for chunk, snapshot, result in self.water_ring_jobs}
+
+        # The layout of the generation plan is only written until a save succeeds
+        plan = self.generation_plan
+        attributes["generation_plan"] = None if plan is None else plan.get_progress()
+        layout = None
+        if not plan is None and not plan.saved:
+            layout = plan
+
+        entities = pickle.dumps((self.entities, self.player), protocol=pickle.HIGHEST_PROTOCOL)
+        if entities == self.saved_entities:
+            entities = None
+
+        return (
+            self.chunks.collect(file.abspath(WORLD_SAVE_FOLDER)),
+            entities,
+            attributes,
+            layout
+        )
+
+    def write_save(self, chunks: tuple, entities: bytes, attributes: dict, layout=None):
+        """
+        Write a snapshot of collect_save. The header is replaced last, so an interrupted save leaves the previous one intact.
+        """
+        rewrite, coords, blobs = chunks
+        chunk_file, index = self.chunks.write(file.abspath(WORLD_SAVE_FOLDER), rewrite, blobs)
+        if not entities is None:
+            file.save(WORLD_SAVE_FOLDER + "/entities.data", entities, file_format="bytes")
+        if not layout is None:
+            file.save(WORLD_SAVE_FOLDER + "/" + WORLD_SAVE_PLAN, pickle.dumps(layout, protocol=pickle.HIGHEST_PROTOCOL), file_format="bytes")
+        header = {
+            "version": WORLD_SAVE_VERSION,
+            "world": attributes,
+            "chunk_file": chunk_file,
+            "coords": coords,
+            "index": index
+        }
+        file.save(WORLD_SAVE_HEADER, header, file_format="pickle")
+        if not entities is None:
+            self.saved_entities = entities
+        if not layout is None:
+            layout.saved = True
+        if attributes["generation_plan"] is None:
+            file.delete(WORLD_SAVE_FOLDER + "/" + WORLD_SAVE_PLAN)
+
+        # Delete chunk files, which are no longer referenced by the header
+        for path in file.find(WORLD_SAVE_FOLDER, "chunks*.data"):
+            if file.basename(path) != chunk_file:
+                file.delete(path)
+
     @staticmethod
     def load(window, block_data):
+        """
+        Load the header and entities of the save. Chunks are read from the chunk file when they are accessed.
+        """
         window.loading_progress[:3] = "Loading world file", 1, 2
-        world = file.load("data/user/world.data", default=0, file_format="pickle")
+        header = file.load(WORLD_SAVE_HEADER, default=0, file_format="pickle")
 
         try:
-            if isinstance(world, World):
+            if isinstance(header, dict) and header.get("version") == WORLD_SAVE_VERSION:
+                window.loading_progress[:3] = "Loading world", 2, 2
+                world = World.__new__(World)
+                world.__dict__.update(header["world"])
+                world.entities, world.player = pickle.loads(file.load(WORLD_SAVE_FOLDER + "/entities.data", file_format="bytes"))
+                world.loaded_entities = set()
+                world.entity_water_obstructions = set()
+                world.dirty_chunks = {}
+                world.view = None
+                world.view_updates = []
+                world.water_view = None
+                world.water_view_updates = []
+                world.water_flags = {}
+                world.water_flags_dirty = set()
+                world.water_ring_queue = deque()
+                world.water_job = None
+                world.water_ring_jobs = []
+                world.water_clamped = 0
+                world.autosave_timer = 0.0
+                world.autosave_thread = None
+                world.saved_entities = None
+                world.chunks = ChunkManager()
+                world.chunks.open(file.abspath(WORLD_SAVE_FOLDER + "/" + header["chunk_file"]), header["coords"], header["index"])
+                if not "water_active" in header["world"]: # Older saves wake all chunks
+                    world.water_active = set(header["coords"])
+                if header["world"].get("generation_plan") is None:
+                    world.generation_plan = None
+                else:
+                    world.generation_plan = pickle.loads(file.load(WORLD_SAVE_FOLDER + "/" + WORLD_SAVE_PLAN, file_format="bytes"))
+                    world.generation_plan.set_progress(header["world"]["generation_plan"])
+                    world.generation_plan.saved = True
+                if not "ticking_blocks" in header["world"]:
+                    world.ticking_blocks = {}
+                    for coord in world.chunks:
+                        world.index_blocks(coord)
+                os.environ["item_count"] = str(world.item_count)
+
+                # Read the chunks around the player
+                chunk_x = int(world.player.rect.x) >> WORLD_CHUNK_SIZE_POWER
+                chunk_y = int(world.player.rect.y) >> WORLD_CHUNK_SIZE_POWER
+                for delta_x in range(-1, 2):
+                    for delta_y in range(-1, 2):
+                        world.chunks.get((chunk_x + delta_x, chunk_y + delta_y))
+                return world
+
+            elif isinstance(header, World):
+                # Pickled world of older versions: only its chunks, entities and progress are kept, the rest is created again
                 window.loading_progress[:3] = "Loading world", 2, 2
+                world = World(*block_data)
+                for key in ("camera_stop", "item_count", "seed"):
+                    if key in header.__dict__:
+                        setattr(world, key, header.__dict__[key])
+                world.entities = header.entities
+                world.player = header.player
                 os.environ["item_count"] = str(world.item_count)
+
+                for coord, chunk in header.chunks.items():
+                    if not isinstance(chunk, Chunk):
+                        chunk = Chunk(array=chunk)
+                        chunk.compress()
+                    world.chunks[coord] = chunk
+                    world.index_blocks(coord)
+                world.water_active = set(world.chunks)
                 return world
         except Exception as e:
             print(e)
             pass
 
-        world = World(*block_data)
         generated = False
         while not generated:
+            world = World(*block_data)
             generated = generate_world(world, window)
 
         return world
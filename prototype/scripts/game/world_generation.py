@@ -1,19 +1,115 @@
 # -*- coding: utf-8 -*-
-from scripts.utility.noise_functions import snoise2
+from scripts.utility.noise_functions import snoise2_grid
 from scripts.utility.const import *
 from scripts.game import structure
 from scripts.game.entity import *
 from scripts.game import cave
+import time
 import copy
 
 
+class GenerationPlan:
+    """
+    Skeleton of a world, laid out before its chunks are generated: the carved caves, the structures and the poles.
+    The cave functions record their writes into it in place of the world (they use seed, chunks, create_chunk and set_region).
+    Chunks are generated from the plan, when they come near the view, see generate_chunks.
+    The layout is written once into its own file of the save, the progress (WORLD_GENERATION_PLAN_PROGRESS) with every save in the header.
+    """
+    def __init__(self, seed: float):
+        self.seed: float = seed
+        self.chunks: dict = {} # {(chunk_x, chunk_y): [(delta_x, delta_y, blocks)]} -> foreground writes into the dirt of each planned chunk, in order
+        self.structures: list = [] # [(x, y, array)]
+        self.chunk_structures: dict = {} # {(chunk_x, chunk_y): [index in structures]}
+        self.poles: list = [] # [(x, bottom, top)] -> vertical caves, which get a pole
+        self.last_enemy_x: float = 0.0
+        self.last_bat: int = 0
+        self.generated: set = set() # chunks, whose blocks are generated
+        self.decorated: set = set() # chunks, whose crates, foliage and enemies are generated
+        self.saved: bool = False # whether the layout is written into the save
+
+    def create_chunk(self, chunk_x: int, chunk_y: int):
+        self.chunks.setdefault((chunk_x, chunk_y), [])
+
+    def set_region(self, start_x: int, start_y: int, data: numpy.array, layer=0, mask: numpy.array=None):
+        """
+        Record a write of foreground blocks with its lower left corner at (start_x, start_y), like World.set_region.
+        """
+        if layer != 0:
+            raise ValueError("Generation plans only record foreground blocks")
+        if mask is None:
+            mask = numpy.ones(data.shape[:2], dtype=bool)
+
+        delta_x, delta_y = numpy.nonzero(mask)
+        blocks = numpy.asarray(data)[delta_x, delta_y].astype(WORLD_CHUNK_DTYPE)
+        x = delta_x + start_x
+        y = delta_y + start_y
+        chunks, inverse = numpy.unique(
+            numpy.stack((x >> WORLD_CHUNK_SIZE_POWER, y >> WORLD_CHUNK_SIZE_POWER), axis=1),
+            axis=0, return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        for index, (chunk_x, chunk_y) in enumerate(chunks.tolist()):
+            selected = inverse == index
+            self.chunks.setdefault((chunk_x, chunk_y), []).append((
+                x[selected] & (WORLD_CHUNK_SIZE - 1), y[selected] & (WORLD_CHUNK_SIZE - 1), blocks[selected]
+            ))
+
+    def add_structure(self, x: int, y: int, array: numpy.array):
+        """
+        Place a structure with its lower left corner at (x, y) over the blocks. Its chunks are planned as well.
+        """
+        self.structures.append((x, y, array))
+        for chunk_x in range(x >> WORLD_CHUNK_SIZE_POWER, ((x + array.shape[0] - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+            for chunk_y in range(y >> WORLD_CHUNK_SIZE_POWER, ((y + array.shape[1] - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+                self.create_chunk(chunk_x, chunk_y)
+                self.chunk_structures.setdefault((chunk_x, chunk_y), []).append(len(self.structures) - 1)
+
+    def get_blocks(self, world, start_x: int, start_y: int, end_x: int, end_y: int):
+        """
+        Returns the carved foreground blocks in [start_x, end_x) x [start_y, end_y) and a mask of the blocks in planned chunks.
+        Blocks outside of planned chunks are 0.
+        """
+        blocks = numpy.zeros((end_x - start_x, end_y - start_y), dtype=WORLD_CHUNK_DTYPE)
+        planned = numpy.zeros(blocks.shape, dtype=bool)
+
+        for coord, chunk_slice_x, chunk_slice_y, region_slice_x, region_slice_y in world.chunk_slices(start_x, start_y, end_x, end_y):
+            writes = self.chunks.get(coord)
+            if writes is None:
+                continue
+            chunk = numpy.full((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE), world.block_name["dirt_block"], dtype=WORLD_CHUNK_DTYPE)
+            for delta_x, delta_y, chunk_blocks in writes:
+                chunk[delta_x, delta_y] = chunk_blocks
+            blocks[region_slice_x, region_slice_y] = chunk[chunk_slice_x, chunk_slice_y]
+            planned[region_slice_x, region_slice_y] = True
+
+        return blocks, planned
+
+    def get_progress(self):
+        """
+        Returns a copy of the progress, which is not changed by generating further chunks (for saving in the background).
+        """
+        return copy.deepcopy({key: self.__dict__[key] for key in WORLD_GENERATION_PLAN_PROGRESS})
+
+    def set_progress(self, progress: dict):
+        self.__dict__.update(progress)
+
+    def __getstate__(self):
+        """
+        Only the layout is pickled, it is not changed after the world is generated.
+        """
+        return {key: value for key, value in self.__dict__.items() if not key in WORLD_GENERATION_PLAN_PROGRESS and key != "saved"}
+
+
 # Called from World
 def generate_world(world, window):
     """
-    Main world generation function
+    Main world generation function. Lays out the generation plan of the world and generates the chunks of its poles,
+    the other chunks are generated near the view by generate_chunks.
+    Returns 0 if the world has to be generated again.
     """
     world.seed: float = random.randint(-10**6, 10**6) + e # Float between -10^6 and 10^6
-    window.loading_progress[2] = 11
+    window.loading_progress[2] = 8
+    plan = GenerationPlan(world.seed)
 
     # Load structures
     window.loading_progress[:2] = "Loading structures", 0
@@ -23,12 +119,11 @@ def generate_world(world, window):
 
     # Starting point
     position = [0, 0]
-    poles = set() # List of x coords of poles
 
     # Generate intro
     window.loading_progress[:2] = "Generating intro", 1
-    cave.intro(world, window, position)
-    cave.horizontal(world, position)
+    cave.intro(plan, window, position)
+    cave.horizontal(plan, position)
 
     # Generate cave segments
     window.loading_progress[:2] = "Generating caves", 5
@@ -40,14 +135,13 @@ def generate_world(world, window):
 
     structure_names = random.sample(list(structures.keys()), k=len(structures))
     structure_index = 0
-    generated_structures = []
 
     for _ in range(segments_count):
         next_special -= 1
 
         if next_special:
             # Horizontal cave
-            cave.horizontal(world, position)
+            cave.horizontal(plan, position)
         else:
             # Special cave (vertical, blob or random structure)
             next_special = min_special_distance + random.randint(0, special_speading)
@@ -63,74 +157,187 @@ def generate_world(world, window):
                     structure_names = random.sample(list(structures.keys()), k=len(structures))
                     structure_index = 0
 
-                cave.interpolated(world, position, end_angle=structure_data["generation"]["entrance_angle"], end_radius=structure_data["generation"]["entrance_size"] / 2)
-
-                generated_structure = (
-                    round(position[0] - structure_data["generation"]["entrance_coord"][0]),
-                    round(position[1] - structure_data["generation"]["entrance_coord"][1]),
-                    structure_data["array"]
-                )
-
-                generated_structures.append(generated_structure)
+                cave.interpolated(plan, position, end_angle=structure_data["generation"]["entrance_angle"], end_radius=structure_data["generation"]["entrance_size"] / 2)
 
-                for dx, dy in numpy.ndindex(generated_structure[2].shape[:2]):
-                    world.set_block(generated_structure[0] + dx, generated_structure[1] + dy, world.block_name["dirt_block"])
+                structure_x = round(position[0] - structure_data["generation"]["entrance_coord"][0])
+                structure_y = round(position[1] - structure_data["generation"]["entrance_coord"][1])
+                plan.set_region(structure_x, structure_y, numpy.full(structure_data["array"].shape[:2], world.block_name["dirt_block"]))
+                plan.add_structure(structure_x, structure_y, structure_data["array"])
 
                 position[0] += structure_data["generation"]["exit_coord"][0] - structure_data["generation"]["entrance_coord"][0]
                 position[1] += structure_data["generation"]["exit_coord"][1] - structure_data["generation"]["entrance_coord"][1]
 
-                cave.interpolated(world, position, start_angle=structure_data["generation"]["exit_angle"], start_radius=structure_data["generation"]["exit_size"] / 2)
+                cave.interpolated(plan, position, start_angle=structure_data["generation"]["exit_angle"], start_radius=structure_data["generation"]["exit_size"] / 2)
 
             elif cave_type < 0.9:
                 # Vertical (no branch)
-                cave.vertical(world, position)
-                poles.add(int(position[0]))
+                start_y = position[1]
+                cave.vertical(plan, position)
+                plan.poles.append((int(position[0]), min(start_y, position[1]), max(start_y, position[1])))
 
             else:
                 # Blob
-                cave.blob(world, position)
+                cave.blob(plan, position)
 
     structure_data = goal_structure
-    cave.interpolated(world, position, end_angle=structure_data["generation"]["entrance_angle"], end_radius=structure_data["generation"]["entrance_size"] / 2)
-    last_enemy_x = position[0]
+    cave.interpolated(plan, position, end_angle=structure_data["generation"]["entrance_angle"], end_radius=structure_data["generation"]["entrance_size"] / 2)
+    plan.last_enemy_x = position[0]
     world.camera_stop = position[0] + 40
-    generated_structures.append((
+    plan.add_structure(
         round(position[0] - structure_data["generation"]["entrance_coord"][0]),
         round(position[1] - structure_data["generation"]["entrance_coord"][1]),
         structure_data["array"]
-    ))
+    )
+    world.generation_plan = plan
 
-    # Smoother cave walls
-    flatten_edges(world)
-    flatten_edges(world)
+    # Generate poles
+    window.loading_progress[:2] = "Generating poles", 7
+    poles_successful = generate_poles(world, plan)
+    if not poles_successful:
+        return 0
 
-    # Generate structures between line cave segments
-    window.loading_progress[:2] = "Generating structures", 7
-    for x, y, array in generated_structures:
-        for dx, dy in numpy.ndindex(array.shape[:2]):
-            world.set_block(x + dx, y + dy, array[dx, dy], layer=slice(None))
+    world.compress_chunks()
+    return 1
 
-    # Generate foliage
-    window.loading_progress[:2] = "Generating foliage", 9
 
-    # Find block edges with air
-    blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left = find_edge_blocks(world)
+# Called from World
+def generate_chunks(world, window):
+    """
+    Generate the planned chunks near the view. Chunks in the view are generated at once, the ones within
+    WORLD_GENERATION_PREFETCH_DISTANCE chunks around it (and the water ring) nearest first, as long as WORLD_GENERATION_BUDGET allows.
+    """
+    plan = world.generation_plan
+    if plan is None:
+        return
+
+    (start_x, start_y), (end_x, end_y) = world.loaded_blocks
+    start_chunk_x = start_x >> WORLD_CHUNK_SIZE_POWER
+    start_chunk_y = start_y >> WORLD_CHUNK_SIZE_POWER
+    end_chunk_x = (end_x - 1) >> WORLD_CHUNK_SIZE_POWER
+    end_chunk_y = (end_y - 1) >> WORLD_CHUNK_SIZE_POWER
+    center_x = (start_chunk_x + end_chunk_x) / 2
+    center_y = (start_chunk_y + end_chunk_y) / 2
+    distance = WORLD_GENERATION_PREFETCH_DISTANCE + max(1, ceil(window.options["simulation distance"] * WORLD_WATER_RING_SCALE))
+    in_view = lambda chunk_x, chunk_y: start_chunk_x <= chunk_x <= end_chunk_x and start_chunk_y <= chunk_y <= end_chunk_y
+
+    chunks = sorted((
+            (chunk_x, chunk_y)
+            for chunk_x in range(start_chunk_x - distance, end_chunk_x + distance + 1)
+            for chunk_y in range(start_chunk_y - distance, end_chunk_y + distance + 1)
+            if (chunk_x, chunk_y) in plan.chunks and not (chunk_x, chunk_y) in plan.decorated
+        ),
+        key=lambda coord: (not in_view(*coord), abs(coord[0] - center_x) + abs(coord[1] - center_y))
+    )
+
+    end_time = time.perf_counter() + WORLD_GENERATION_BUDGET
+    for chunk_x, chunk_y in chunks:
+        if not in_view(chunk_x, chunk_y) and time.perf_counter() > end_time:
+            break
+        decorate_chunk(world, plan, chunk_x, chunk_y)
+
+    if len(plan.decorated) == len(plan.chunks):
+        world.generation_plan = None
+
+
+def generate_chunk_range(world, plan, start_chunk_x: int, start_chunk_y: int, end_chunk_x: int, end_chunk_y: int):
+    """
+    Generate the blocks of the planned chunks in [start_chunk_x, end_chunk_x] x [start_chunk_y, end_chunk_y], which are not generated yet.
+    """
+    for chunk_x in range(start_chunk_x, end_chunk_x + 1):
+        for chunk_y in range(start_chunk_y, end_chunk_y + 1):
+            if (chunk_x, chunk_y) in plan.chunks and not (chunk_x, chunk_y) in plan.generated:
+                plan.generated.add((chunk_x, chunk_y)) # Before generating, as writing the chunk creates it through World.create_chunk
+                generate_chunk(world, plan, chunk_x, chunk_y)
 
-    # Generate poles
-    poles_successful = generate_poles(world, poles, blocks_ground, blocks_ceiling)
-    if not poles_successful:
-        return 0
 
-    # Generate foliage
+def generate_chunk(world, plan, chunk_x: int, chunk_y: int):
+    """
+    Generate the blocks of a planned chunk: smooth the carved cave walls, place the structures and generate the terrain.
+    Only the plan is read, so the blocks don't depend on the order, in which chunks are generated.
+    """
+    start_x = chunk_x * WORLD_CHUNK_SIZE
+    start_y = chunk_y * WORLD_CHUNK_SIZE
+
+    # Two smoothing passes need a border of two blocks, the terrain needs the row above the chunk
+    blocks, planned = plan.get_blocks(world, start_x - 2, start_y - 2, start_x + WORLD_CHUNK_SIZE + 2, start_y + WORLD_CHUNK_SIZE + 3)
+    plants = numpy.zeros_like(blocks)
+    for _ in range(2):
+        blocks, plants, planned = flatten_edges(world, blocks, plants, planned)
+
+    data = numpy.zeros((*blocks.shape, 4), dtype=WORLD_CHUNK_DTYPE)
+    data[:, :, 0] = blocks
+    data[:, :, 1] = plants
+    structure_indices = set(plan.chunk_structures.get((chunk_x, chunk_y), ())) | set(plan.chunk_structures.get((chunk_x, chunk_y + 1), ()))
+    for index in sorted(structure_indices):
+        x, y, array = plan.structures[index]
+        left = max(x, start_x)
+        right = min(x + array.shape[0], start_x + WORLD_CHUNK_SIZE)
+        bottom = max(y, start_y)
+        top = min(y + array.shape[1], start_y + WORLD_CHUNK_SIZE + 1)
+        if left < right and bottom < top:
+            data[left - start_x:right - start_x, bottom - start_y:top - start_y] = array[left - x:right - x, bottom - y:top - y]
+
+    data[:, :-1, 0] = generate_terrain(world, start_x, start_y, data[:, :, 0])
+    world.set_region(start_x, start_y, data[:, :-1], layer=slice(None))
+
+
+def decorate_chunk(world, plan, chunk_x: int, chunk_y: int):
+    """
+    Replace the crates of a planned chunk with entities and generate its foliage and enemies.
+    The blocks of the neighbouring chunks are generated first, as decorations reach into them.
+    Random numbers are seeded by the chunk, so decorations don't depend on the order, in which chunks are generated.
+    """
+    generate_chunk_range(world, plan, chunk_x - 1, chunk_y - 1, chunk_x + 1, chunk_y + 1)
+    random_state = random.getstate()
+    random.seed(f"{plan.seed} {chunk_x} {chunk_y}")
+
+    start_x = chunk_x * WORLD_CHUNK_SIZE
+    start_y = chunk_y * WORLD_CHUNK_SIZE
+    end_x = start_x + WORLD_CHUNK_SIZE
+    end_y = start_y + WORLD_CHUNK_SIZE
+
+    # Replace crate blocks
+    crates = world.get_region(start_x, start_y, end_x, end_y, layer=0) == world.block_name["crate"]
+    if crates.any():
+        world.set_region(start_x, start_y, numpy.zeros(crates.shape, dtype=WORLD_CHUNK_DTYPE), layer=0, mask=crates)
+        for delta_x, delta_y in numpy.argwhere(crates).tolist():
+            world.add_entity(Crate((start_x + delta_x, start_y + delta_y)))
+
+    blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left = find_edge_blocks(world, start_x, start_y, end_x, end_y)
     generate_foliage(world, blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left)
+    spawn_enemies(world, plan, blocks_ground)
 
-    # Spawn enemies
-    window.loading_progress[:2] = "Spawing enemies", 11
-    spawn_blocks = sorted(random.sample(list(blocks_ground), k=int(0.1 * len(blocks_ground))))
-    last_bat = 0
+    plan.decorated.add((chunk_x, chunk_y))
+    random.setstate(random_state)
 
-    for coord in spawn_blocks:
-        if coord[0] < 30 or coord[1] > -500 or world.get_block(coord[0], coord[1] + 1) or coord[0] > last_enemy_x or world.get_water(coord[0], coord[1]):
+
+def find_edge_blocks(world, start_x: int, start_y: int, end_x: int, end_y: int):
+    """
+    Classify the air blocks in [start_x, end_x) x [start_y, end_y), which are next to blocks.
+    Returns the coordinates of the air blocks on the ground, on the ceiling, on a wall to the right and on a wall to the left
+    as int arrays of shape (n, 2), each block in the first matching class.
+    """
+    region = world.get_region(start_x - 1, start_y - 1, end_x + 1, end_y + 1, layer=0)
+    remaining = region[1:-1, 1:-1] == 0
+    edge_blocks = []
+    for solid in (
+        region[1:-1, :-2] > 0, # On ground
+        region[1:-1, 2:] > 0, # On ceiling
+        region[2:, 1:-1] > 0, # On wall right
+        region[:-2, 1:-1] > 0 # On wall left
+    ):
+        edge_blocks.append(numpy.argwhere(remaining & solid) + (start_x, start_y))
+        remaining &= ~solid
+
+    return edge_blocks
+
+
+def spawn_enemies(world, plan, blocks_ground):
+    spawn_blocks = blocks_ground[random.sample(range(len(blocks_ground)), k=int(0.1 * len(blocks_ground)))]
+    spawn_blocks = spawn_blocks[numpy.lexsort(spawn_blocks.T[::-1])] # Sorted by x, then y
+
+    for coord in map(tuple, spawn_blocks.tolist()):
+        if coord[0] < 30 or coord[1] > -500 or world.get_block(coord[0], coord[1] + 1) or coord[0] > plan.last_enemy_x or world.get_water(coord[0], coord[1]):
             continue
         if coord[0] < 100:
             if random.randint(0, 1):
@@ -145,55 +352,20 @@ def generate_world(world, window):
         else:
             Entity = random.choice((GreenSlime, YellowSlime, BlueSlime, Bat, Goblin))
         if Entity == Bat:
-            if coord[0] < last_bat + 10:
+            if abs(coord[0] - plan.last_bat) < 10:
                 continue
-            last_bat = coord[0]
+            plan.last_bat = coord[0]
         world.add_entity(Entity(coord))
 
-    return 1
-
-
-# Called from generate_world
-def find_edge_blocks(world):
-    blocks_ground = set()
-    blocks_ceiling = set()
-    blocks_wall_right = set()
-    blocks_wall_left = set()
-
-    for coord in world.iterate():
-        block_type = world.get_block(*coord, layer=0)
-
-        if block_type == world.block_name["dirt_block"]: # Generate terrain block
-            generate_block(world, *coord)
-            continue
-        elif block_type == world.block_name["crate"]:
-            world.set_block(*coord, 0)
-            world.add_entity(Crate(coord))
-        elif block_type != 0: # Not air
-            continue
-
-        x, y = coord
-
-        if world.get_block(x, y - 1) > 0: # On ground
-            blocks_ground.add(coord)
-        elif world.get_block(x, y + 1) > 0: # On ceiling
-            blocks_ceiling.add(coord)
-        elif world.get_block(x + 1, y) > 0: # On wall right
-            blocks_wall_right.add(coord)
-        elif world.get_block(x - 1, y) > 0: # On wall left
-            blocks_wall_left.add(coord)
-
-    return blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left
 
-
-# Called from generate_world
+# Called from decorate_chunk
 def generate_foliage(world, blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left):
-    blocks_ground = random.sample(list(blocks_ground), k=int(WORLD_VEGETATION_FLOOR_DENSITY * len(blocks_ground)))
-    blocks_ceiling = random.choices(list(blocks_ceiling), k=int(WORLD_VEGETATION_CEILING_DENSITY * len(blocks_ceiling)))
-    blocks_wall_right = random.choices(list(blocks_wall_right), k=int(WORLD_VEGETATION_WALL_DENSITY * len(blocks_wall_right)))
-    blocks_wall_left = random.choices(list(blocks_wall_left), k=int(WORLD_VEGETATION_WALL_DENSITY * len(blocks_wall_left)))
+    blocks_ground = blocks_ground[random.sample(range(len(blocks_ground)), k=int(WORLD_VEGETATION_FLOOR_DENSITY * len(blocks_ground)))]
+    blocks_ceiling = blocks_ceiling[random.choices(range(len(blocks_ceiling)), k=int(WORLD_VEGETATION_CEILING_DENSITY * len(blocks_ceiling)))]
+    blocks_wall_right = blocks_wall_right[random.choices(range(len(blocks_wall_right)), k=int(WORLD_VEGETATION_WALL_DENSITY * len(blocks_wall_right)))]
+    blocks_wall_left = blocks_wall_left[random.choices(range(len(blocks_wall_left)), k=int(WORLD_VEGETATION_WALL_DENSITY * len(blocks_wall_left)))]
 
-    for (x, y) in blocks_ground + blocks_ceiling + blocks_wall_right + blocks_wall_left:
+    for x, y in numpy.concatenate((blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left)).tolist():
         args = get_decoration_block_type(world, x, y)
         if not args[0] is None:
             generate_decoration_block(world, x, y, *args)
@@ -252,25 +424,12 @@ def get_decoration_block_type(world, x, y):
     else:
         return [None]
 
-    block_comparison = ("any", block_name, world.block_family[block_name])
-
-    decoration_list = list(filter(lambda name: (
-        any([selected in block_comparison for selected in world.block_generation_properties[name].get("on", "any").split("|")]) and
-        side == world.block_generation_properties[name].get("side", "above") and
-        (bool(water_level) == world.block_generation_properties[name].get("water", False) or
-        "any" == world.block_generation_properties[name].get("water", False)) and
-        corner == world.block_generation_properties[name].get("corner", False)
-    ), list(world.block_generation_properties)))
-
-    if not len(decoration_list):
+    rules = world.decoration_rules.get((side, corner, bool(water_level), block_name)) or world.decoration_rules.get((side, corner, bool(water_level), world.block_family[block_name]))
+    if rules is None:
         return [None]
 
-    decoration_block = random.choices(decoration_list, weights=[world.block_generation_properties[name].get("weight", 1) for name in decoration_list])
-
-    if len(decoration_block):
-        decoration_block = decoration_block[0]
-    else:
-        decoration_block = None
+    decoration_list, cumulative_weights = rules
+    decoration_block = random.choices(decoration_list, cum_weights=cumulative_weights)[0]
 
     return decoration_block, flipped, side
 
@@ -327,11 +486,28 @@ def generate_decoration_block(world, x, y, decoration_block, flipped, side):
 
 
 # Called from generate_world
-def generate_poles(world, poles, blocks_ground, blocks_ceiling):
-    blocks_ground = dict(blocks_ground)
-    blocks_ceiling = dict(blocks_ceiling)
+def generate_poles(world, plan):
+    """
+    Place a pole, rope or vines in each vertical cave of the plan, generating the chunks around it.
+    The ground and ceiling are searched within WORLD_GENERATION_POLE_MARGIN blocks below and above the cave.
+    Returns False if a vertical cave has no room for a pole.
+    """
+    for x, bottom, top in plan.poles:
+        start_y = floor(bottom) - WORLD_GENERATION_POLE_MARGIN
+        end_y = ceil(top) + WORLD_GENERATION_POLE_MARGIN
+
+        # Blocks up to 50 above the ceiling are searched
+        generate_chunk_range(
+            world, plan,
+            (x - 3) >> WORLD_CHUNK_SIZE_POWER, (start_y - 1) >> WORLD_CHUNK_SIZE_POWER,
+            (x + 3) >> WORLD_CHUNK_SIZE_POWER, (end_y + 50) >> WORLD_CHUNK_SIZE_POWER
+        )
+        blocks_ground, blocks_ceiling = find_edge_blocks(world, x - 2, start_y, x + 3, end_y)[:2]
+
+        # Lowest ground and highest ceiling of each column
+        blocks_ground = dict(sorted(blocks_ground.tolist(), key=lambda coord: -coord[1]))
+        blocks_ceiling = dict(sorted(blocks_ceiling.tolist(), key=lambda coord: coord[1]))
 
-    for x in poles:
         pole_x = x
         pole_y_ground = 0
         pole_y_ceiling = 0
@@ -381,32 +557,55 @@ def generate_poles(world, poles, blocks_ground, blocks_ceiling):
     return True
 
 
-# Called from generate_world
-def flatten_edges(world):
-    world_copy = copy.deepcopy(world)
-    for x, y in world_copy.iterate():
-        block_types = [world_copy.get_block(x + dx, y + dy, layer=0, default=1) for dx in range(-1, 2) for dy in range(-1, 2)]
-        block_type = max(block_types, key=block_types.count)
-        world.set_block(x, y, block_type)
-
-
-def generate_block(world, x, y, repeat=0):
-    if x > 30:
-        z = snoise2(x / 8 + world.seed, y / 8 + world.seed, octaves=3, persistence=0.1, lacunarity=5)
-    if x > 20: # Interpolation (from intro)
-        z1 = snoise2(x / 16 + world.seed, y / 16, octaves=3, persistence=0.1, lacunarity=5, repeaty=repeat / 16)
-        z2 = snoise2(x / 8 + world.seed, y / 8 + world.seed, octaves=3, persistence=0.1, lacunarity=5)
-        i = (x - 20) / 10
-        z = z1 * i + z2 * (1 - i)
-    else: # Repeating (intro)
-        z = snoise2(x / 16 + world.seed, y / 16, octaves=3, persistence=0.1, lacunarity=5, repeaty=repeat / 16)
+# Called from generate_chunk
+def flatten_edges(world, blocks: numpy.array, plants: numpy.array, planned: numpy.array):
+    """
+    Replace each foreground block with the most common block of its 3x3 neighbourhood (the first one in neighbour order on ties).
+    Blocks outside of planned chunks count as 1 and are kept; winning blocks of other layers are written into plants.
+    Returns blocks, plants and planned without their outer border.
+    """
+    votes = numpy.where(planned, blocks, 1)
+    width, height = blocks.shape[0] - 2, blocks.shape[1] - 2
+    neighbours = numpy.stack([
+        votes[1 + delta_x:width + 1 + delta_x, 1 + delta_y:height + 1 + delta_y]
+        for delta_x in range(-1, 2) for delta_y in range(-1, 2)
+    ])
+    counts = (neighbours[:, None] == neighbours[None, :]).sum(axis=1)
+    block_types = numpy.take_along_axis(neighbours, counts.argmax(axis=0)[None], axis=0)[0]
+
+    blocks = blocks[1:-1, 1:-1]
+    plants = plants[1:-1, 1:-1]
+    planned = planned[1:-1, 1:-1]
+    foreground = world.lookup_layer[block_types] == 0
+    return (
+        numpy.where(planned & foreground, block_types, blocks),
+        numpy.where(planned & ~foreground, block_types, plants),
+        planned
+    )
+
+
+def generate_terrain(world, start_x: int, start_y: int, blocks: numpy.array, repeat=0):
+    """
+    Returns the foreground blocks of a chunk with its dirt turned into dirt, grass (air above) or stone blocks, depending on noise.
+    blocks: foreground blocks of the chunk and the row above it.
+    """
+    dirt = blocks[:, :-1] == world.block_name["dirt_block"]
+    if not dirt.any():
+        return blocks[:, :-1]
+
+    x = numpy.arange(start_x, start_x + WORLD_CHUNK_SIZE)
+    y = numpy.arange(start_y, start_y + WORLD_CHUNK_SIZE)
+    z = snoise2_grid(x / 16 + world.seed, y / 16, octaves=3, persistence=0.1, lacunarity=5, repeaty=repeat / 16) # Repeating (intro)
+    if x[-1] > 20: # Interpolation (from intro), extrapolated beyond x = 30
+        i = ((x - 20) / 10)[:, None]
+        z2 = snoise2_grid(x / 8 + world.seed, y / 8 + world.seed, octaves=3, persistence=0.1, lacunarity=5)
+        z = numpy.where((x > 20)[:, None], z * i + z2 * (1 - i), z)
 
     threshold = 0.2 # -1 < z < 1
 
-    block = "dirt_block"
-    if z < threshold and world.get_block(x, y + 1) == 0: # When air is above
-        block = "grass_block"
-    elif z >= threshold:
-        block = "stone_block"
-    
-    world.set_block(x, y, world.block_name[block])
+    terrain = numpy.where(
+        z >= threshold,
+        world.block_name["stone_block"],
+        numpy.where(blocks[:, 1:] == 0, world.block_name["grass_block"], world.block_name["dirt_block"]) # When air is above
+    ).astype(WORLD_CHUNK_DTYPE)
+    return numpy.where(dirt, terrain, blocks[:, :-1])
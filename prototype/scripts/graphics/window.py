@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from scripts.graphics.image import load_sprites, get_sprite_rect
-from scripts.utility.const import OPENGL_VERSION, PLATFORM
+from scripts.utility.const import OPENGL_VERSION, PLATFORM, WORLD_CHUNK_DTYPE
 from scripts.utility.language import translate
 from scripts.graphics.shader import Shader
 from scripts.graphics.camera import Camera
@@ -127,7 +127,11 @@ class Window:
             (self.width, self.height), flags=flags, vsync=self.options["enable vsync"])
         self._clock = pygame.time.Clock()
         self.camera: Camera = Camera(self)
-        self.world_view: numpy.array = numpy.empty((0, 0, 4))
+        self.world_view: numpy.array = numpy.empty((0, 0, 4), dtype=WORLD_CHUNK_DTYPE)
+        self.world_view_start: tuple = (0, 0) # World coord of world_view[0, 0]
+        self.world_view_updates: list = [] # World rects, which changed since the last upload
+        self.world_water_view: numpy.array = numpy.empty((0, 0, 4), dtype=WORLD_CHUNK_DTYPE) # Water render flags of world_view
+        self.world_water_view_updates: list = [] # World rects, in which the water render flags changed since the last upload
         pygame.display.set_caption(caption)
         pygame.key.set_repeat(500, 50)
 
@@ -228,6 +232,7 @@ class Window:
         # Create world texture (contains world block data)
         self._world_size = (0, 0)
         self._texWorld = None
+        self._texWater = None
 
         # Create block texture
         self._texBlocks = self._texture(block_atlas_image)
@@ -253,7 +258,9 @@ class Window:
                 "texFont": "int",
                 "texBlocks": "int",
                 "texWorld": "int",
+                "texWater": "int",
                 "texShadow": "int",
+                "world_ring": "ivec2",
                 "offset": "vec2",
                 "camera": "vec2",
                 "resolution": "float",
@@ -263,7 +270,8 @@ class Window:
                 "damage_screen": "float"
             },
             constants={
-                "block." + key: value for key, (value, *_) in block_data.items()
+                **{"block." + key: value for key, (value, *_) in block_data.items()},
+                **{"water_flag." + key: value for key, value in WORLD_WATER_FLAGS.items()}
             },
         )
 
@@ -272,6 +280,7 @@ class Window:
         self._instance_shader.setvar("texBlocks", 2)
         self._instance_shader.setvar("texWorld", 3)
         self._instance_shader.setvar("texShadow", 4)
+        self._instance_shader.setvar("texWater", 5)
         self._instance_shader.setvar("resolution", self.camera.resolution)
         self._instance_shader.setvar(
             "shadow_resolution", self.options["shadow resolution"])
@@ -609,6 +618,7 @@ class Window:
             self._texFont,
             self._texBlocks,
             self._texWorld,
+            self._texWater,
             self._texShadow,
         ]
         while None in textures:
@@ -629,7 +639,14 @@ class Window:
         """
         Clear the world view.
         """
-        self.world_view.fill(0)
+        self.world_view = numpy.zeros_like(self.world_view)
+        self.world_water_view = numpy.zeros_like(self.world_water_view)
+        self.world_view_updates = [(
+            *self.world_view_start,
+            self.world_view_start[0] + self.world_view.shape[0],
+            self.world_view_start[1] + self.world_view.shape[1]
+        )]
+        self.world_water_view_updates = self.world_view_updates.copy()
 
     def _texture(self, image, blur=False):
         """
@@ -672,10 +689,10 @@ class Window:
         )
 
         if not all(self.world_view.shape):
-            if not self._texWorld is None:
-                GL.glDeleteTextures(1, (self._texWorld,))
-                self._texWorld = None
-                self._world_size = (0, 0)
+            self._delete_world_textures()
+            self._world_size = (0, 0)
+            self.world_view_updates.clear()
+            self.world_water_view_updates.clear()
             return
 
         # Draw shadows
@@ -691,40 +708,97 @@ class Window:
 
         # View size
         size = self.world_view.shape[:2]
-        data = numpy.array(numpy.swapaxes(
-            self.world_view, 0, 1), dtype=numpy.int32)
 
         if self._world_size != size:
-            if not self._texWorld is None:
-                GL.glDeleteTextures(1, (self._texWorld,))
-                self._texWorld = None
+            self._delete_world_textures()
             self._world_size = size
 
+        # The textures are ring buffers: world block (x, y) is stored at (x % width, y % height)
+        start_x, start_y = self.world_view_start
+        self._instance_shader.setvar("world_ring", start_x % size[0], start_y % size[1])
+        full_rect = (start_x, start_y, start_x + size[0], start_y + size[1])
+
         if self._texWorld is None:
-            # Generate new texture
-            texture = GL.glGenTextures(1)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
-            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA32I, *
-                            self._world_size, 0, GL.GL_RGBA_INTEGER, GL.GL_INT, data)
-            GL.glTexParameteri(
-                GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
-            GL.glTexParameteri(
-                GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
-            GL.glTexParameteri(
-                GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
-            GL.glTexParameteri(
-                GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-            GL.glActiveTexture(GL.GL_TEXTURE3)
+            self._texWorld = self._world_texture(GL.GL_TEXTURE3)
+            self.world_view_updates[:] = [full_rect]
+        if self._texWater is None:
+            self._texWater = self._world_texture(GL.GL_TEXTURE5)
+            self.world_water_view_updates[:] = [full_rect]
+
+        # Too many small uploads are slower than a single one
+        for texture, unit, view, updates in (
+            (self._texWorld, GL.GL_TEXTURE3, self.world_view, self.world_view_updates),
+            (self._texWater, GL.GL_TEXTURE5, self.world_water_view, self.world_water_view_updates)
+        ):
+            if len(updates) > 64:
+                updates[:] = [full_rect]
+            GL.glActiveTexture(unit)
             GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
-            self._texWorld = texture
-        else:
-            # Write world data into texture
-            GL.glBindTexture(GL.GL_TEXTURE_2D, self._texWorld)
-            # GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA32I, *self._world_size, 0, GL.GL_RGBA_INTEGER, GL.GL_INT, data)
-            GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, *
-                               self._world_size, GL.GL_RGBA_INTEGER, GL.GL_INT, data)
-            # GL.glBufferData(GL.GL_TEXTURE_2D, data.nbytes, data, GL.GL_STREAM_COPY)
+            for rect in updates:
+                self._upload_world_rect(view, *rect)
+            updates.clear()
+
+        # Other textures are bound to unit 0 without selecting it
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+
+    def _world_texture(self, unit):
+        """
+        Create an integer texture of the world size and bind it to a texture unit.
+        """
+        texture = GL.glGenTextures(1)
+        GL.glActiveTexture(unit)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA16I, *
+                        self._world_size, 0, GL.GL_RGBA_INTEGER, GL.GL_SHORT, None)
+        GL.glTexParameteri(
+            GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
+        GL.glTexParameteri(
+            GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
+        GL.glTexParameteri(
+            GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
+        GL.glTexParameteri(
+            GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
+        return texture
+
+    def _delete_world_textures(self):
+        """
+        Delete the world and water textures; they are created again on the next update.
+        """
+        for texture in (self._texWorld, self._texWater):
+            if not texture is None:
+                GL.glDeleteTextures(1, (texture,))
+        self._texWorld = None
+        self._texWater = None
+
+    def _upload_world_rect(self, view, start_x, start_y, end_x, end_y):
+        """
+        Write a world rect of a view (world view or water render flags) into the bound texture.
+        """
+        width, height = self._world_size
+        start_x = max(start_x, self.world_view_start[0])
+        start_y = max(start_y, self.world_view_start[1])
+        end_x = min(end_x, self.world_view_start[0] + width)
+        end_y = min(end_y, self.world_view_start[1] + height)
+
+        # Split rect at the edges of the ring buffer
+        x = start_x
+        while x < end_x:
+            ring_x = x % width
+            part_end_x = min(end_x, x + width - ring_x)
+
+            y = start_y
+            while y < end_y:
+                ring_y = y % height
+                part_end_y = min(end_y, y + height - ring_y)
+
+                data = numpy.ascontiguousarray(numpy.swapaxes(view[
+                    x - self.world_view_start[0]:part_end_x - self.world_view_start[0],
+                    y - self.world_view_start[1]:part_end_y - self.world_view_start[1]
+                ], 0, 1))
+                GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, ring_x, ring_y, part_end_x - x,
+                                   part_end_y - y, GL.GL_RGBA_INTEGER, GL.GL_SHORT, data)
+                y = part_end_y
+            x = part_end_x
 
     def _draw_shadows(self, offset, player_position):
         """
@@ -2,7 +2,7 @@
 from scripts.graphics.image import load_sprites, get_sprite_rect
 from scripts.utility.language import translate
 from scripts.graphics.camera import Camera
-from scripts.utility.const import PLATFORM
+from scripts.utility.const import PLATFORM, WORLD_CHUNK_DTYPE
 from scripts.graphics import particle
 from scripts.utility import options
 from scripts.utility import file
@@ -85,7 +85,11 @@ class Window:
         self._window = pygame.display.set_mode((self.width, self.height), flags=flags, vsync=self.options["enable vsync"])
         self._clock = pygame.time.Clock()
         self.camera: Camera = Camera(self)
-        self.world_view: numpy.array = numpy.empty((0, 0, 4))
+        self.world_view: numpy.array = numpy.empty((0, 0, 4), dtype=WORLD_CHUNK_DTYPE)
+        self.world_view_start: tuple = (0, 0) # World coord of world_view[0, 0]
+        self.world_view_updates: list = [] # Unused; the whole view is drawn each frame
+        self.world_water_view: numpy.array = numpy.empty((0, 0, 4), dtype=WORLD_CHUNK_DTYPE) # Unused
+        self.world_water_view_updates: list = [] # Unused
         pygame.display.set_caption(caption)
         pygame.key.set_repeat(500, 50)
 
@@ -315,7 +319,8 @@ class Window:
         """
         Clear the world view.
         """
-        self.world_view.fill(0)
+        self.world_view = numpy.zeros_like(self.world_view)
+        self.world_water_view = numpy.zeros_like(self.world_water_view)
     
     def _texture(self, image, blur=False):
         """
@@ -490,6 +495,8 @@ class Window:
             self.camera.pos[1] % 1 - (self.height / 2 / self.camera.pixels_per_meter) % 1
         )
 
+        self.world_view_updates.clear()
+        self.world_water_view_updates.clear()
         for x_coord, y_coord in numpy.ndindex(self.world_view.shape[:2]):
             for layer in (2, 0, 1):
                 block = self.world_view[x_coord, y_coord][layer]
@@ -409,7 +409,8 @@ class Menu:
 
         ###---###  Delete world page  ###---###
         def button_delete_world_confirm_update():
-            file.delete("data/user/world.data")
+            file.delete(WORLD_SAVE_HEADER)
+            file.delete(WORLD_SAVE_FOLDER)
             settings_world_page.open()
 
         delete_world_page = Page(parent=settings_world_page, columns=1, spacing=MENU_SPACING)
@@ -423,8 +424,8 @@ class Menu:
 
         ###---###  Delete inventory page  ###---###
         def button_delete_inventory_confirm_update():
-            if file.exists("data/user/world.data"):
-                file.delete("data/user/world.data")
+            file.delete(WORLD_SAVE_HEADER)
+            file.delete(WORLD_SAVE_FOLDER)
             if file.exists("data/user/inventory.data"):
                 file.delete("data/user/inventory.data")
             settings_world_page.open()
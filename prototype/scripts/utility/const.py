@@ -69,11 +69,27 @@ PHYSICS_WALL_JUMP_THRESHOLD: float = 0.3 # Time to jump after leaving a wall in
 PHYSICS_MAX_MOVE_DISTANCE: float = 1.0 # Maximum distance in blocks, which an object can travel each tick
 
 BLOCKS_CLIMBABLE: tuple = ("pole", "vines0", "vines0_flipped", "ladder", "rope")
+BLOCKS_TICKING: tuple = ("torch", "torch_flipped") # Blocks updated each tick
 
 WORLD_UPDATE_INTERVAL = 0.1 # Delay between world updates
 WORLD_CHUNK_SIZE_POWER = 5
 WORLD_CHUNK_SIZE = 2 ** WORLD_CHUNK_SIZE_POWER
+WORLD_CHUNK_DTYPE: str = "int16" # Block ids and signed water level of chunks
+WORLD_CHUNK_PALETTE: bool = True # Store inactive chunks as uint8 indices into a per-chunk palette
+WORLD_CHUNK_COMPRESS_INTERVAL: float = 5.0 # Delay between compressing chunks outside of the view
+WORLD_CHUNK_BUDGET: int = 1024 # Maximum number of chunks kept in memory, least recently used chunks are paged to disk
+WORLD_CHUNK_PREFETCH_DISTANCE: int = 2 # Chunks ahead of the camera movement, which are paged in before they are visible
+WORLD_CHUNK_PREFETCH_LIMIT: int = 4 # Maximum number of chunks prefetched per frame
+WORLD_SAVE_HEADER: str = "data/user/world.data" # World attributes and chunk index
+WORLD_SAVE_FOLDER: str = "data/user/world" # Entities and chunk file
+WORLD_SAVE_VERSION: int = 1
+WORLD_SAVE_PLAN: str = "plan.data" # Layout of the chunks, which are not generated yet, in the save folder
+WORLD_AUTOSAVE_INTERVAL: float = 60.0 # Delay between writing changed chunks and entities into the save in the background
 WORLD_WATER_PER_BLOCK: int = 1000
+WORLD_WATER_RING_SCALE: float = 0.2 # Chunks simulated around the view per block of simulation distance
+WORLD_WATER_RING_INTERVAL: float = 0.5 # Delay between water steps of chunks around the view
+WORLD_WATER_RING_BUDGET: float = 0.002 # Time per world update for starting water steps of chunks around the view
+WORLD_WATER_FLAGS: dict = {"full": 1, "surface": 2, "falling": 4, "corner": 8, "side": 16} # Render flags of water blocks, see water.render_flags
 WORLD_WIND_STRENGTH: int = 20
 WORLD_BLOCK_SIZE: int = 16
 
@@ -85,6 +101,10 @@ WORLD_GENERATION_CAVE_BORDER_PADDING: int = 4
 WORLD_GENERATION_HORIZONTAL_CAVE_RADIUS: int = 3
 WORLD_GENERATION_STEP_SIZE: float = 0.5
 WORLD_GENERATION_INTERPOLATION_LENGTH: int = 20
+WORLD_GENERATION_PREFETCH_DISTANCE: int = 1 # Chunks around the view (and the water ring), which are generated before they become visible
+WORLD_GENERATION_BUDGET: float = 0.004 # Time per frame for generating chunks outside of the view
+WORLD_GENERATION_POLE_MARGIN: int = 8 # Blocks below and above a vertical cave, in which the ground and ceiling of its pole are searched
+WORLD_GENERATION_PLAN_PROGRESS: tuple = ("generated", "decorated", "last_enemy_x", "last_bat") # Generation plan attributes, which change while chunks are generated
 
 DAMAGE_COLORS: list = [(232, 193, 112, 255), (222, 158, 65, 255), (218, 134, 62, 255), (207, 87, 60, 255), (165, 48, 48, 255), (117, 36, 56, 255), (65, 29, 49, 255), (64, 39, 81, 255), (122, 54, 123, 255), (162, 62, 140, 255), (198, 81, 151, 255)]
 INT_TO_ROMAN: dict = {1: "I", 2: "II", 3: "III", 4: "IV", 5: "V", 6: "VI", 7: "VII", 8: "VIII", 9: "IX", 10: "X", 11: "XI", 12: "XII", 13: "XIII", 14: "XIV", 15: "XV", 16: "XVI", 17: "XVII", 18: "XVIII", 19: "XIX", 20: "XX"}
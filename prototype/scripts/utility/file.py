@@ -3,6 +3,7 @@ from scripts.utility.const import *
 import pickle
 import json
 import glob
+import shutil
 
 
 dirpath = os.path.dirname
@@ -78,6 +79,10 @@ def load(path: str, default=None, file_format="text", split=False):
             except EOFError:
                 return None
 
+        elif file_format == "bytes":
+            with open(path, "rb") as f:
+                data = f.read()
+
         elif file_format == "numpy":
             data = numpy.load(path)
 
@@ -89,7 +94,7 @@ def load(path: str, default=None, file_format="text", split=False):
 
 def save(path: str, data, file_format="text"):
     """
-    Writes into a file.
+    Writes into a file. The data is written into a temporary file first, which replaces the file when it is complete.
     """
     if not os.path.isabs(path):
         path = abspath(path)
@@ -97,20 +102,36 @@ def save(path: str, data, file_format="text"):
     # Create folders
     os.makedirs(os.path.dirname(path), exist_ok=True)
 
+    if file_format == "numpy":
+        numpy.save(path, data)
+        return
+
+    temp_path = path + ".tmp"
     if file_format == "text":
-        with open(path, "w") as f:
-             f.write(data)
+        with open(temp_path, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
 
     elif file_format == "json":
-        with open(path, "w") as f:
+        with open(temp_path, "w") as f:
             json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
 
     elif file_format == "pickle":
-        with open(path, 'wb') as f:
+        with open(temp_path, 'wb') as f:
             pickle.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
 
-    elif file_format == "numpy":
-        numpy.save(path, data)
+    elif file_format == "bytes":
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    os.replace(temp_path, path)
 
     
 def exists(path: str):
@@ -120,8 +141,13 @@ def exists(path: str):
 
 
 def delete(path: str):
+    """
+    Deletes a file or a folder with its contents.
+    """
     if not os.path.isabs(path):
         path = abspath(path)
 
-    if os.path.exists(path):
-        os.remove(path) 
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
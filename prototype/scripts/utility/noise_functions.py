@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import opensimplex
 from math import *
+import numpy
 
 
 def pnoise1(x: float, octaves: int=1, persistence: float=0.5, lacunarity: float=2.0, repeat: float=0):
@@ -30,3 +31,46 @@ def snoise2(x: float, y: float, octaves: int=1, persistence: float=0.5, lacunari
         z += opensimplex.noise2(x / divisor, y / divisor) / divisor
 
     return z
+
+
+def pnoise1_array(x: numpy.array, octaves: int=1, persistence: float=0.5, lacunarity: float=2.0, repeat: float=0):
+    """
+    pnoise1 of every value of x, evaluated with one array call per octave. Returns an array of the shape of x.
+    """
+    x = numpy.asarray(x, dtype=float)
+    z = numpy.zeros(x.shape)
+    octaves = min(octaves, 3)
+
+    if repeat:
+        x = repeat_array(x, repeat, 2.928)
+
+    for i in range(octaves):
+        divisor = 2 ** i
+        z += opensimplex.noise2array(x.ravel() / divisor, numpy.array([e]))[0].reshape(x.shape) / divisor
+
+    return z
+
+def snoise2_grid(x: numpy.array, y: numpy.array, octaves: int=1, persistence: float=0.5, lacunarity: float=2.0, repeatx: float=0, repeaty: float=0):
+    """
+    snoise2 of every combination of the values of x and y, evaluated with one array call per octave.
+    Returns an array of shape (len(x), len(y)).
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    z = numpy.zeros((len(x), len(y)))
+    octaves = min(octaves, 3)
+
+    if repeatx:
+        x = repeat_array(x, repeatx, 0.214)
+    if repeaty:
+        y = repeat_array(y, repeaty, 1.331)
+
+    for i in range(octaves):
+        divisor = 2 ** i
+        z += opensimplex.noise2array(x / divisor, y / divisor).T / divisor
+
+    return z
+
+def repeat_array(x: numpy.array, repeat: float, phase: float):
+    # math.sin, so results match the scalar functions exactly
+    return numpy.abs(numpy.fromiter((sin(value * pi / repeat + phase) for value in x.ravel().tolist()), dtype=float, count=x.size).reshape(x.shape) * repeat)